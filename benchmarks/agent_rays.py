@@ -0,0 +1,29 @@
+"""
+Times the agent rays of Raycast for random schools of different sizes, run from the repository root:
+    PYTHONPATH=src python benchmarks/agent_rays.py
+"""
+import time
+import numpy as np
+from raycasts import Raycast
+
+def benchmarkAgentRays(counts_fishes = [3, 10, 20, 50, 100], rows = 1000, max_view_range = 200, world = (960, 720), seed = 0):
+    """
+    Times the agent rays of Raycast for random schools of different sizes in a world of the given size
+    """
+    rng = np.random.default_rng(seed)
+    for count_fishes in counts_fishes:
+        centers = rng.uniform((0, 0), world, (rows, count_fishes, 2))
+        heads = centers + rng.normal(size = (rows, count_fishes, 2))
+        tracks = np.concatenate([heads, centers], axis = 2).reshape(rows, count_fishes * 4)
+
+        ray = Raycast([], 21, 15, 300, 180, max_view_range, count_fishes)
+        ray._getFish(tracks)
+        start = time.perf_counter()
+        row_ids, _, _, _ = ray._getFishRays()
+        ray._getAgentRays()
+        seconds = time.perf_counter() - start
+        print("{:4} fish: {:.2f}ms per frame, {:.1f} of {} other fish in view range on average".format(count_fishes, 1000 * seconds / rows, len(row_ids) / (rows * count_fishes), count_fishes - 1))
+
+
+if __name__ == "__main__":
+    benchmarkAgentRays()
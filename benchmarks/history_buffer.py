@@ -0,0 +1,42 @@
+"""
+Compares shifting the testNetwork history with np.delete/np.append against HistoryBuffer, run from the repository root:
+    PYTHONPATH=src python benchmarks/history_buffer.py
+"""
+import time
+import tracemalloc
+import numpy as np
+from functions import HistoryBuffer
+
+def benchmarkHistoryBuffer(sequence_length = 70, dim = 33, steps = 1000):
+    """
+    Bytes allocated per step and time per step for shifting a (1, sequence_length, dim) history
+    with np.delete/np.append (as testNetwork did) and with HistoryBuffer, measured with tracemalloc
+    """
+    window = np.random.rand(1, sequence_length, dim)
+    rows = np.random.rand(steps, dim)
+
+    def shift(cur_X, row):
+        cur_X = np.delete(cur_X, 0, axis = 1)
+        return np.append(cur_X, row.reshape(1, 1, dim), axis = 1)
+
+    def ring(history, row):
+        history.append(row)
+        history.view()[np.newaxis]
+        return history
+
+    for name, step, state in [("np.delete/np.append", shift, window), ("HistoryBuffer", ring, HistoryBuffer(window[0]))]:
+        tracemalloc.start()
+        allocated = 0
+        t = time.perf_counter()
+        for row in rows:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            state = step(state, row)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+        t = time.perf_counter() - t
+        tracemalloc.stop()
+        print("{:20}: {:8.0f} bytes/step, {:.4f} ms/step".format(name, allocated / steps, t / steps * 1000))
+
+
+if __name__ == "__main__":
+    benchmarkHistoryBuffer()
@@ -2,6 +2,12 @@ import numpy as np
 import pandas as pd
 import math
 import imageio
+import os
+import json
+import hashlib
+import tempfile
+import collections
+from scipy.spatial import cKDTree
 
 def getRedPoints(cluster_distance = 25, path = "I:/Code/SWP/Raycasts/data/redpoints_walls.jpg", red_min_value = 200):
     """
@@ -9,18 +15,49 @@ def getRedPoints(cluster_distance = 25, path = "I:/Code/SWP/Raycasts/data/redpoi
     The points are read from the picture in a way such that points that exceed the red_min_value will be taken and only one will be considered in the range of cluster_distance.
     """
     im = imageio.imread(path)
-    point_cluster_center = []
-    add_new = True
-    for i in range(0, im.shape[0]):
-        for j in range(0, im.shape[1]):
-            add_new = True
-            if im[i, j, 0] > red_min_value:
-                for k in range(0, len(point_cluster_center)):
-                    if getDistance(point_cluster_center[k][0], point_cluster_center[k][1], j, i) < cluster_distance:
-                        add_new = False
-                if add_new:
-                    point_cluster_center.append((j,i))
-    return point_cluster_center
+    #all red pixels, in the order of rows first (same order as scanning the picture row by row)
+    red_y, red_x = np.nonzero(im[:, :, 0] > red_min_value)
+    red_points = np.stack([red_x, red_y], axis = 1).astype(np.int64)
+
+    #greedily take every red pixel that is not in range of a point taken before
+    #there can not be more centers than red pixels, so the first count_centers rows of a preallocated array are enough
+    point_cluster_center = np.empty((len(red_points), 2), dtype = np.int64)
+    count_centers = 0
+    for point in red_points:
+        if not np.any(np.sum((point_cluster_center[:count_centers] - point)**2, axis = 1) < cluster_distance**2):
+            point_cluster_center[count_centers] = point
+            count_centers += 1
+    return [(int(x), int(y)) for x, y in point_cluster_center[:count_centers]]
+
+def getWallLines(path = "data/final_redpoint_wall.jpg", cluster_distance = 25, red_min_value = 200, cache_dir = "data/cache"):
+    """
+    Returns defineLines(getRedPoints(...)) for the given picture of the tank.
+    The lines are cached as json file in cache_dir, keyed by the content of the picture and the parameters, None disables the cache.
+    """
+    cache_path = None
+    if cache_dir is not None:
+        with open(path, "rb") as f:
+            key = hashlib.sha1(f.read())
+        key.update(repr((cluster_distance, red_min_value)).encode())
+        cache_path = os.path.join(cache_dir, "wall_lines_" + key.hexdigest() + ".json")
+        if os.path.isfile(cache_path):
+            with open(cache_path, "r") as f:
+                return [tuple(line) for line in json.load(f)]
+
+    lines = defineLines(getRedPoints(cluster_distance = cluster_distance, path = path, red_min_value = red_min_value))
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok = True)
+        #write to a temporary file next to the cache file and move it in place, so readers never see a half written cache
+        fd, tmp_path = tempfile.mkstemp(dir = cache_dir, suffix = ".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(lines, f)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return lines
 
 def defineLines(points):
     """
@@ -28,23 +65,31 @@ def defineLines(points):
     Points given have to be sorted by x or y (ascending or descending) in order for this to work correctly, if given unsorted this might return wrong values.
     """
     lines_list = []
-    #First of we choose a point to look at, then we search for the nearest nearest other point (from our pot) to that one and remove the chosen point from our pot.
-    while len(points) > 1:
-        current_point = points[0]
-        points.pop(0)
-        cur_min_index = 0
-        cur_min_dist = getDistance(current_point[0], current_point[1], points[0][0], points[0][1])
-        for  i in range(1, len(points)):
-            temp = getDistance(current_point[0], current_point[1], points[i][0], points[i][1])
-            if temp < cur_min_dist:
-                cur_min_dist = temp
-                cur_min_index = i
-        lines_list.append((current_point[0], current_point[1], points[cur_min_index][0], points[cur_min_index][1]))
+    coords = np.array(points, dtype = float).reshape(-1, 2)
+    n_points = len(points)
+    tree = cKDTree(coords)
+    #Each point is connected to its nearest point among the ones after it in the list (the first one on equal distances).
+    #We ask the tree for the k nearest points and take more until one of them comes after the current point.
+    for i in range(0, n_points - 1):
+        k = min(8, n_points)
+        while True:
+            distances, indices = tree.query(coords[i], k = k)
+            later = indices > i
+            if np.any(later):
+                min_dist = distances[later].min()
+                #make sure that all points with the same distance are part of the result
+                if k == n_points or distances[-1] > min_dist:
+                    break
+            elif k == n_points:
+                break
+            k = min(2 * k, n_points)
+        nearest = indices[later & (distances == min_dist)].min()
+        lines_list.append((points[i][0], points[i][1], points[nearest][0], points[nearest][1]))
 
     #For our last line to be computed correctly, we take the 2 points that were only used once for now and define a line between them.
     temp = []
     lines_list_single_points = [(elem[0], elem[1]) for elem in lines_list] + [(elem[2], elem[3]) for elem in lines_list]
-    count_points = {x:lines_list_single_points.count(x) for x in lines_list_single_points}
+    count_points = collections.Counter(lines_list_single_points)
     for elem in count_points.items():
         if elem[1] == 1:
             temp.append(elem[0])
@@ -75,6 +120,30 @@ def get_intersect(a1, a2, b1, b2):
         return (float('inf'), float('inf'))
     return (x/z, y/z)
 
+def getRayDistances(origins, directions, lines):
+    """
+    Intersects rays with line segments and returns for each ray the distance to the nearest segment it hits.
+    origins: array (..., 2) with the start points of the rays
+    directions: array (..., 2) with the unit vectors of the rays, broadcastable against origins
+    lines: list or array (n_lines, 4) of segments (x1, y1, x2, y2)
+    Output: array (...) of distances, inf where a ray does not hit any segment
+    Only hits in front of the ray (distance >= 0) and between the two points of the segment are counted.
+    """
+    lines = np.asarray(lines, dtype = float)
+    seg_start = lines[:, 0:2]
+    seg_vec = lines[:, 2:4] - seg_start
+    origins = np.asarray(origins, dtype = float)[..., np.newaxis, :]
+    directions = np.asarray(directions, dtype = float)[..., np.newaxis, :]
+
+    # solve origin + t * direction = seg_start + u * seg_vec with 2d cross products
+    to_seg = seg_start - origins
+    denom = directions[..., 0] * seg_vec[:, 1] - directions[..., 1] * seg_vec[:, 0]
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        t = (to_seg[..., 0] * seg_vec[:, 1] - to_seg[..., 1] * seg_vec[:, 0]) / denom
+        u = (to_seg[..., 0] * directions[..., 1] - to_seg[..., 1] * directions[..., 0]) / denom
+    hit = (denom != 0) & (t >= 0) & (u >= 0) & (u <= 1)
+    return np.where(hit, t, np.inf).min(axis = -1)
+
 def getAngle(vector1, vector2, mode = "degrees"):
     """
     Given 2 vectors, in the form of tuples (x1, y1) this will return an angle in degrees, if not specfified further.
@@ -153,25 +222,19 @@ def readClusters(path):
 def distancesToClusters(points, clusters):
     """
     computes distances from all points to all clusters
-    not sure if this works for non 1d data
+    points: array of any shape, clusters: 1d list of cluster centers
+    output: array of shape points.shape + (len(clusters),)
     """
-    distances = None
-    for j in range(0, len(clusters)):
-        temp = np.abs(points - float(clusters[j])).reshape(-1, 1)
-        if j == 0:
-            distances = temp
-        else:
-            distances = np.append(distances, temp, axis = 1)
-
-    return distances
+    points = np.asarray(points, dtype = float)
+    return np.abs(points[..., np.newaxis] - np.asarray(clusters, dtype = float))
 
 
 def softmax(np_array):
     """
-    Compute softmax values row-wise (probabilites)
+    Compute softmax values row-wise (probabilites), along the last axis
     """
-    temp = np.exp(np_array - np.max(np_array, axis = 1).reshape(-1, 1))
-    return np.divide(temp, np.sum(temp, axis = 1).reshape(-1, 1))
+    temp = np.exp(np_array - np.max(np_array, axis = -1, keepdims = True))
+    return np.divide(temp, np.sum(temp, axis = -1, keepdims = True))
 
 
 def selectPercentage(array, seed = None):
@@ -254,41 +317,153 @@ def readStartposition(path):
 
 def getAngles( v1, v2 ):
     """
-    Takes 2 np.arrays with points treated as vectors
+    Takes 2 np.arrays with points treated as vectors, xy in the last axis,
+    leading axes are broadcasted against each other
     """
-    assert v1.shape == v2.shape
-    assert v1.shape[1] == 2
-    dot = np.sum( v1 * v2, axis=1 )
-    det = np.subtract( ( v1[:,0] * v2[:,1] ), ( v2[:,0] * v1[:,1] ) )
+    assert v1.shape[-1] == 2 and v2.shape[-1] == 2
+    dot = v1[...,0] * v2[...,0] + v1[...,1] * v2[...,1]
+    det = np.subtract( ( v1[...,0] * v2[...,1] ), ( v2[...,0] * v1[...,1] ) )
     angle = np.arctan2( det, dot )
     return angle % ( np.pi * 2 )
 
 
 def getDistances( p1, p2 ):
     """
-    Takes 2 np.arrays with points, returns the distances
-    """
-    return np.linalg.norm( p1 - p2, axis=1 )
+    Takes 2 np.arrays with points, xy in the last axis, returns the distances
+    """
+    diff = p1 - p2
+    return np.hypot( diff[...,0], diff[...,1] )
+
+
+def getTrackView( tracks, nfish, nnodes ):
+    """
+    Returns tracks in the format of extract_coordinates() as a 4d view
+    (frames, fish, nodes, xy), without copying
+    [
+        [head1_x, head1_y, center1_x, center1_y, ..., head2_x, ...]
+        ...
+    ]
+    Only the first nfish * nnodes * 2 columns are used.
+    """
+    rows, cols = tracks.shape
+    assert cols >= nfish * nnodes * 2
+    return tracks[:,:nfish * nnodes * 2].reshape( rows, nfish, nnodes, 2 )
+
+
+class RunningMeanStd:
+    """
+    Streaming mean and (population) standard deviation over the rows of 2d arrays,
+    updated batch wise with the parallel variance formula of Chan et al., so no rows have to be kept.
+    Accumulators of different workers (it pickles) can be combined with merge().
+    """
+    def __init__(self, dim):
+        self.count = 0
+        self.mean = np.zeros(dim)
+        self.m2 = np.zeros(dim) # sum of squared differences from the mean
+
+    def _combine(self, count, mean, m2):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta**2 * (self.count * count / total)
+        self.count = total
+
+    def update(self, batch):
+        """
+        Adds the rows of batch (rows, dim)
+        """
+        batch = np.asarray(batch, dtype = np.float64)
+        if len(batch) == 0:
+            return
+        mean = batch.mean(axis = 0)
+        self._combine(len(batch), mean, ((batch - mean)**2).sum(axis = 0))
+
+    def merge(self, other):
+        """
+        Adds all rows seen by other
+        """
+        self._combine(other.count, other.mean, other.m2)
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.count)
+
+
+class HistoryBuffer:
+    """
+    Preallocated ring buffer of the last rows of a 2d array, e.g. the observation history of a fish in a simulation.
+    Every row is stored twice, so the history in order (oldest first) is always a contiguous view, append() and view()
+    don't allocate.
+    """
+    def __init__(self, window):
+        window = np.asarray(window)
+        self.length = len(window)
+        self._buffer = np.empty((2 * self.length,) + window.shape[1:], dtype = float)
+        self._buffer[:self.length] = window
+        self._buffer[self.length:] = window
+        self._start = 0
+
+    def append(self, row):
+        """
+        Replaces the oldest row by row
+        """
+        self._buffer[self._start] = row
+        self._buffer[self._start + self.length] = row
+        self._start = (self._start + 1) % self.length
+
+    def view(self):
+        """
+        Returns the rows in order, oldest first, as a view which changes with the next append()
+        """
+        return self._buffer[self._start : self._start + self.length]
 
 
 def multivariate_data(dataset, target, start_index, end_index, history_size, target_size, step, single_step=False):
-  data = []
-  labels = []
+  """
+  Taken from https://www.tensorflow.org/tutorials/structured_data/time_series
+  Windows are returned as read-only strided views of dataset and target, nothing is copied:
+  data[k] == dataset[start_index + k : start_index + k + history_size : step]
+  """
+  dataset = np.asarray(dataset)
+  target = np.asarray(target)
 
   start_index = start_index + history_size
   if end_index is None:
     end_index = len(dataset) - target_size
+  count = max(end_index - start_index, 0)
 
-  for i in range(start_index, end_index):
-    indices = range(i-history_size, i, step)
-    data.append(dataset[indices])
-
+  if count == 0 or len(dataset) < history_size:
+    # no complete window, e.g. a subtrack shorter than history_size
+    data = np.empty((0, len(range(0, history_size, step))) + dataset.shape[1:], dtype = dataset.dtype)
     if single_step:
-      labels.append(target[i+target_size])
+      labels = np.empty((0,) + target.shape[1:], dtype = target.dtype)
     else:
-      labels.append(target[i:i+target_size])
+      labels = np.empty((0, target_size) + target.shape[1:], dtype = target.dtype)
+    return data, labels
+
+  # windows[k] = dataset[k : k + history_size], window axis moved in front of the features
+  windows = np.moveaxis(np.lib.stride_tricks.sliding_window_view(dataset, history_size, axis = 0), -1, 1)
+  data = windows[start_index - history_size : start_index - history_size + count, ::step]
+
+  if single_step:
+    labels = target[start_index + target_size : start_index + target_size + count]
+  else:
+    labels = np.moveaxis(np.lib.stride_tricks.sliding_window_view(target, target_size, axis = 0), -1, 1)[start_index : start_index + count]
+
+  return data, labels
+
+def getWindows(data, ends, history_size):
+    """
+    Returns the windows data[end - history_size:end] for every end as one (len(ends), history_size, ...) array,
+    these are the windows of multivariate_data (step 1) for the ends start_index + history_size ... end_index - 1,
+    the matching single_step labels are target[ends + target_size].
+    Only use for batches or small selections, since this copies.
+    """
+    return data[np.asarray(ends)[:, np.newaxis] + np.arange(-history_size, 0)]
 
-  return np.array(data), np.array(labels)
 
 def convertAngle(lin_mov, angle):
     """
@@ -1,7 +1,7 @@
 import numpy as np
 import pandas as pd
 import math
-from functions import getAngle, getDistance, readClusters, distancesToClusters, softmax, get_indices, convPolarToCart, get_distances, getAngles, getDistances, convertAngle
+from functions import getAngle, getDistance, readClusters, distancesToClusters, softmax, get_indices, convPolarToCart, get_distances, getAngles, getDistances, getTrackView, convertAngle
 from itertools import chain
 from reader import *
 from sklearn.cluster import KMeans
@@ -11,48 +11,35 @@ def getLocomotion(np_array, path_to_save_to = None, mode="radians"):
     This function expects to be given a numpy array of the shape (rows, count_fishes*4) and saves a csv file at a given path (path has to end on .csv).
     The information about each given fish (or object in general) should be first_position_x, first_position_y, second_position_x, second_position_y.
     It is assumed that the fish is looking into the direction of first_positon_x - second_position_x for x and first_positon_y - second_position_y for y.
+    Output per fish: movement of the center in x and y (rotated into the view of the fish) and change of orientation in [-pi, pi]
+    ([-180, 180] if mode is "degrees"). All frames and fishes are computed at once.
     """
-    header = np.array([list(chain.from_iterable(("Fish_" + str(i) + "_next_x", "Fish_" + str(i) + "_next_y", "Fish_" + str(i) + "_angle_change_orientation") for i in range(0, int(np_array.shape[1]/4))))])
-    output = np.empty((np_array.shape[0]-1, header.shape[1]))
-
-    for i in range(0, np_array.shape[0]-1):
-        if i!=0 and i%1000 == 0:
-            print("||| Frame " + str(i) + " finished. |||")
-        new_row = [0 for k in range(0, int(3*np_array.shape[1]/4))]
-        for j in range(0, int(np_array.shape[1]/4)):
-            head_x = np_array[i, j*4]
-            head_y = np_array[i, j*4+1]
-            center_x = np_array[i, j*4+2]
-            center_y = np_array[i, j*4+3]
-
-            head_x_next = np_array[i+1, j*4]
-            head_y_next = np_array[i+1, j*4+1]
-            center_x_next = np_array[i+1, j*4+2]
-            center_y_next = np_array[i+1, j*4+3]
-
-            #look vector
-            look_vector = (head_x - center_x, head_y - center_y)
-            #new look vector
-            look_vector_next = (head_x_next - center_x_next, head_y_next - center_y_next)
-
-            #convert coordinates to egocentric view (use this https://en.wikipedia.org/wiki/Rotation_of_axes) and use center of current timestep as origin
-            rotate_axis = getAngle(look_vector, (1, 0), mode = mode)
-
-            #convert center of timestep t
-            center_x = center_x * math.cos(rotate_axis) + center_y * math.sin(rotate_axis)
-            center_y = center_y * math.cos(rotate_axis) - center_x * math.sin(rotate_axis)
-            #convert center of timestep t+1
-            center_x_next = center_x_next * math.cos(rotate_axis) + center_y_next * math.sin(rotate_axis)
-            center_y_next = center_y_next * math.cos(rotate_axis) - center_x_next * math.sin(rotate_axis)
-
-            #move first, then change orientation when reconstructing
-            new_row[j*3] = center_x_next - center_x
-            new_row[j*3+1] = center_y_next - center_y
-            new_row[j*3+2] = getAngle(look_vector, look_vector_next, mode = mode)
-
-            #convert ori from 0,2pi to -pi,pi
-            new_row[j*3+2] = new_row[j*3+2]-2*np.pi if new_row[j*3+2] > np.pi else new_row[j*3+2]
-        output[i] = new_row
+    nfish = int(np_array.shape[1]/4)
+    header = np.array([list(chain.from_iterable(("Fish_" + str(i) + "_next_x", "Fish_" + str(i) + "_next_y", "Fish_" + str(i) + "_angle_change_orientation") for i in range(0, nfish)))])
+
+    fishes = np.asarray(np_array[:, :nfish*4], dtype = float).reshape(-1, nfish, 4)
+    #look vectors (head - center) of timestep t and t+1
+    look_vector = fishes[:-1, :, 0:2] - fishes[:-1, :, 2:4]
+    look_vector_next = fishes[1:, :, 0:2] - fishes[1:, :, 2:4]
+    #movement of the center from timestep t to t+1
+    movement = fishes[1:, :, 2:4] - fishes[:-1, :, 2:4]
+
+    #convert coordinates to egocentric view (use this https://en.wikipedia.org/wiki/Rotation_of_axes) and use center of current timestep as origin
+    #same as getAngle(look_vector, (1, 0), mode = "radians")
+    rotate_axis = np.arctan2(-look_vector[:, :, 1], look_vector[:, :, 0]) % (2*np.pi)
+    cos, sin = np.cos(rotate_axis), np.sin(rotate_axis)
+
+    output = np.empty((len(fishes)-1, nfish, 3))
+    #move first, then change orientation when reconstructing
+    output[:, :, 0] = movement[:, :, 0] * cos + movement[:, :, 1] * sin
+    output[:, :, 1] = movement[:, :, 1] * cos - movement[:, :, 0] * sin
+    #same as getAngle(look_vector, look_vector_next, mode = "radians"), converted from 0,2pi to -pi,pi
+    dot = look_vector[:, :, 0] * look_vector_next[:, :, 0] + look_vector[:, :, 1] * look_vector_next[:, :, 1]
+    det = look_vector[:, :, 0] * look_vector_next[:, :, 1] - look_vector[:, :, 1] * look_vector_next[:, :, 0]
+    ori = np.arctan2(det, dot) % (2*np.pi)
+    ori = np.where(ori > np.pi, ori - 2*np.pi, ori)
+    output[:, :, 2] = np.degrees(ori) if mode == "degrees" else ori
+    output = output.reshape(len(fishes)-1, nfish*3)
 
     if path_to_save_to == None:
         return output
@@ -60,63 +47,113 @@ def getLocomotion(np_array, path_to_save_to = None, mode="radians"):
         df = pd.DataFrame(data = output, columns = header[0])
         df.to_csv(path_to_save_to, index = None, sep = ";")
 
-def convertLocmotionToBin(loco, clusters_path, path_to_save = None, probabilities = True):
-    #get cluster centers
+def getLocomotionBinHeader(nfish, clusters_path):
+    """
+    Returns the column names of the output of convertLocmotionToBin as list of strings
+    """
     clusters_mov, clusters_pos, clusters_ori = readClusters(clusters_path)
-
-    result = None
-    #convert locomotion into bin representation for each fish
-    for i in range(0, int(loco.shape[1]/3)):
+    header = []
+    for i in range(0, nfish):
+        header += ["Fish_" + str(i) + "_prob_next_x_bin_" + str(j) for j in range(0, len(clusters_mov))]
+        header += ["Fish_" + str(i) + "_prob_next_y_bin_" + str(j) for j in range(0, len(clusters_pos))]
+        header += ["Fish_" + str(i) + "_prob_ori_bin_" + str(j) for j in range(0, len(clusters_ori))]
+    return header
+
+def convertLocmotionToBin(loco, clusters_path, path_to_save = None, probabilities = True, top_k = None):
+    """
+    Converts locomotion (output of getLocomotion) into a bin representation using the cluster centers from clusters_path.
+    probabilities = True: softmax over the inverted distances to all cluster centers, otherwise 1 for the nearest cluster center and 0 else
+    Returns a float32 array of shape (rows, nfish * (count_mov + count_pos + count_ori)), column names are given by getLocomotionBinHeader.
+    top_k: if given, only the k biggest bins per fish and locomotion type are kept and (indices, values) is returned instead,
+           both of shape (rows, nfish * 3, top_k) with the second axis ordered like [fish0_mov, fish0_pos, fish0_ori, fish1_mov, ...],
+           use topKToDense to get the full representation back.
+    If path_to_save is given the result is saved there instead, as ;-separated csv or as .npz file with top_k.
+    """
+    #get cluster centers
+    clusters = readClusters(clusters_path)
+    nfish = int(loco.shape[1]/3)
+    loco = np.asarray(loco, dtype = float).reshape(-1, nfish, 3)
+
+    #convert locomotion into bin representation for all fish at once, one (rows, nfish, count_clusters) array per locomotion type
+    bins = []
+    for k in range(0, 3):
+        distances = distancesToClusters(loco[:, :, k], clusters[k])
         if probabilities:
-            #compute distances to cluster centers and invert them (1/x) (exp so we do not get divide by zero)
-            dist_mov = 1 / np.exp(distancesToClusters(loco[:, i*3], clusters_mov))
-            dist_pos = 1 / np.exp(distancesToClusters(loco[:, i*3+1], clusters_pos))
-            dist_ori = 1 / np.exp(distancesToClusters(loco[:, i*3+2], clusters_ori))
-
-            #get probabilites row-wise with softmax function and append header
-            prob_mov = np.append(np.array([["Fish_" + str(i) + "_prob_next_x_bin_" + str(j) for j in range(0, len(clusters_mov))]]), softmax(dist_mov), axis = 0)
-            prob_pos = np.append(np.array([["Fish_" + str(i) + "_prob_next_y_bin_" + str(j) for j in range(0, len(clusters_pos))]]), softmax(dist_pos), axis = 0)
-            prob_ori = np.append(np.array([["Fish_" + str(i) + "_prob_ori_bin_" + str(j) for j in range(0, len(clusters_ori))]]), softmax(dist_ori), axis = 0)
-
-            temp = np.append(np.append(prob_mov, prob_pos, axis = 1), prob_ori, axis = 1)
-            if i == 0:
-                result = temp
-            else:
-                result = np.append(result, temp , axis = 1)
+            #invert the distances to cluster centers (1/x) (exp so we do not get divide by zero), get probabilites with softmax
+            bins.append(softmax(1 / np.exp(distances)).astype(np.float32))
         else:
-            #todo
-            pass
-
+            nearest = np.zeros(distances.shape, dtype = np.float32)
+            np.put_along_axis(nearest, np.argmin(distances, axis = -1)[..., np.newaxis], 1, axis = -1)
+            bins.append(nearest)
+
+    if top_k is not None:
+        indices = np.empty((len(loco), nfish, 3, top_k), dtype = np.int16)
+        values = np.empty((len(loco), nfish, 3, top_k), dtype = np.float32)
+        for k in range(0, 3):
+            indices[:, :, k] = np.argsort(-bins[k], axis = -1, kind = "stable")[..., :top_k]
+            values[:, :, k] = np.take_along_axis(bins[k], indices[:, :, k].astype(np.int64), axis = -1)
+        indices, values = indices.reshape(len(loco), nfish*3, top_k), values.reshape(len(loco), nfish*3, top_k)
+        if path_to_save == None:
+            return indices, values
+        np.savez(path_to_save, indices = indices, values = values, counts = np.array([len(c) for c in clusters]))
+        return
+
+    result = np.concatenate(bins, axis = -1).reshape(len(loco), -1)
     if path_to_save == None:
-        return result[1:]
+        return result
     else:
-        df = pd.DataFrame(data = result[1:], columns = result[0])
+        df = pd.DataFrame(data = result, columns = getLocomotionBinHeader(nfish, clusters_path))
         df.to_csv(path_to_save, sep = ";")
 
+def topKToDense(indices, values, counts):
+    """
+    Converts the top_k output of convertLocmotionToBin back into the dense representation,
+    counts: amount of clusters for (mov, pos, ori), bins that were not kept are 0
+    """
+    rows, groups, _ = indices.shape
+    nfish = groups // 3
+    indices = indices.reshape(rows, nfish, 3, -1)
+    values = values.reshape(rows, nfish, 3, -1)
+    result = []
+    for k in range(0, 3):
+        dense = np.zeros((rows, nfish, counts[k]), dtype = values.dtype)
+        np.put_along_axis(dense, indices[:, :, k].astype(np.int64), values[:, :, k], axis = -1)
+        result.append(dense)
+    return np.concatenate(result, axis = -1).reshape(rows, -1)
+
 
 def row_l2c( coords, locs ):
     """
-    Returns 1d ndarray with new coordinates based on previos coordinades and given locomotions,
+    Returns ndarray with new coordinates based on previos coordinades and given locomotions,
     Output: [center1_x, center1_y, orientation1, ...]
+    coords and locs may have leading batch dimensions, the last one holds 3 entries per fish
     """
-    nfish = len(coords) // 3
-
-    # coords indices
-    xs = [3 * x for x in range(nfish)]
-    ys = [3 * x + 1 for x in range(nfish)]
-    os = [3 * x + 2 for x in range(nfish)]
-    # locs indices
-    lin = [3 * x for x in range(nfish)]
-    ang = [3 * x + 1 for x in range(nfish)]
-    ori = [3 * x + 2 for x in range(nfish)]
+    coords = np.asarray( coords, dtype=float )
+    locs = np.asarray( locs, dtype=float )
     # computation
-    new_angles = ( coords[os] + locs[ang] ) % ( np.pi * 2 )
-    xvals = np.cos( new_angles ) * np.abs( locs[lin] )
-    yvals = np.sin( new_angles ) * np.abs( locs[lin] )
+    new_angles = ( coords[...,2::3] + locs[...,1::3] ) % ( np.pi * 2 )
+    lin = np.abs( locs[...,0::3] )
     out = np.empty( coords.shape )
-    out[xs] = coords[xs] + xvals
-    out[ys] = coords[ys] + yvals
-    out[os] = ( coords[os] + locs[ori] ) % ( np.pi * 2 )
+    out[...,0::3] = coords[...,0::3] + np.cos( new_angles ) * lin
+    out[...,1::3] = coords[...,1::3] + np.sin( new_angles ) * lin
+    out[...,2::3] = ( coords[...,2::3] + locs[...,2::3] ) % ( np.pi * 2 )
+    return out
+
+
+def row_l2c_additional_nodes( coords, nodes ):
+    """
+    Returns positions of nodes given relative to the center of one fish, as computed by getnLoc
+    coords: [center_x, center_y, orientation]
+    nodes: [node1_dis, node1_ang, node2_dis, node2_ang, ...], angle relative to the orientation
+    Output: [node1_x, node1_y, node2_x, node2_y, ...]
+    both may have leading batch dimensions
+    """
+    coords = np.asarray( coords, dtype=float )
+    nodes = np.asarray( nodes, dtype=float )
+    angles = coords[...,2,np.newaxis] + nodes[...,1::2]
+    out = np.empty( nodes.shape )
+    out[...,0::2] = coords[...,0,np.newaxis] + np.cos( angles ) * nodes[...,0::2]
+    out[...,1::2] = coords[...,1,np.newaxis] + np.sin( angles ) * nodes[...,0::2]
     return out
 
 
@@ -131,65 +168,84 @@ def convLocToCart( loc, startpoints ):
             [fish1_lin, fish1_ang, fish1_trn, fish2_lin, fish2_ang, fish2_trn, ...]
             ...
         ]
+        or 3d array with a leading batch dimension, to convert many sequences at once
     startpoints:
         two nodes per fish exactly:
         [head1_x, head1_y, center1_x, center1_y, head2_x, head2_y, center2_x, center2_y,...]
+        or 2d array with one row per sequence in the batch
     Output:
-
+        one row more than loc (the start position), with a leading batch dimension if loc has one
         [
-            [center1_x, center1_y, orientation1, ...]
-            [center1_x, center1_y, orientation1, ...]
+            [head1_x, head1_y, center1_x, center1_y, ...]
+            [head1_x, head1_y, center1_x, center1_y, ...]
             ...
         ]
+    Orientation is the cumulative sum of the turn movements, the position the cumulative sum of the
+    movements rotated by orientation + angular movement (same as applying row_l2c row by row).
     """
-    row, col = loc.shape
+    loc = np.asarray( loc, dtype=float )
+    startpoints = np.asarray( startpoints, dtype=float )
+    batched = loc.ndim == 3
+    if not batched:
+        loc = loc[np.newaxis]
+        startpoints = startpoints[np.newaxis]
+    batch, row, col = loc.shape
     assert row > 1
     assert col % 3 == 0
     nfish = col // 3
-    assert len(startpoints) / nfish == 4
-
-    # save [center1_x, center2_y, orientation1, center2_x, ...] for every fish
-    out = np.empty([row + 1,nfish * 3])
-
-    # 1. Distances Center - Head, out setup
-    disCH = []
-    for f in range(nfish):
-        disCH.append( getDistance( startpoints[4 * f], startpoints[4 * f + 1], startpoints[4 * f + 2], startpoints[4 * f + 3] ) )
-        out[0,3 * f] = startpoints[4 * f + 2]
-        out[0,3 * f + 1] = startpoints[4 * f + 3]
-        # Angle between Fish Orientation and the unit vector
-        out[0,3 * f + 2] = getAngle( (1,0,), (startpoints[4 * f] - startpoints[4 * f + 2], startpoints[4 * f + 1] - startpoints[4 * f + 3],), "radians" )
-
-    for i in range(0, row):
-        out[i + 1] = row_l2c( out[i], loc[i] )
-
-    return convPolarToCart( out, disCH )
+    assert startpoints.shape == ( batch, nfish * 4 )
+
+    loc = loc.reshape( batch, row, nfish, 3 )
+    start = startpoints.reshape( batch, nfish, 4 )
+    head_start = start[:,:,0:2]
+    center_start = start[:,:,2:4]
+
+    # 1. Distances Center - Head, angle between fish orientation and the unit vector
+    vec_ch = head_start - center_start
+    disCH = np.linalg.norm( vec_ch, axis=-1 )
+    ori_start = np.arctan2( vec_ch[:,:,1], vec_ch[:,:,0] ) % ( np.pi * 2 )
+
+    # 2. Orientation in every row, the orientation before a row is used to move in that row
+    ori = np.empty( ( batch, row + 1, nfish ) )
+    ori[:,0] = ori_start
+    ori[:,1:] = ori_start[:,np.newaxis] + np.cumsum( loc[:,:,:,2], axis=1 )
+    ori %= np.pi * 2
+
+    # 3. Center positions
+    move_angle = ori[:,:-1] + loc[:,:,:,1]
+    lin = np.abs( loc[:,:,:,0] )
+    out = np.empty( ( batch, row + 1, nfish, 4 ) )
+    out[:,0,:,2:4] = center_start
+    out[:,1:,:,2] = center_start[:,np.newaxis,:,0] + np.cumsum( np.cos( move_angle ) * lin, axis=1 )
+    out[:,1:,:,3] = center_start[:,np.newaxis,:,1] + np.cumsum( np.sin( move_angle ) * lin, axis=1 )
+
+    # 4. Head positions from center, orientation and distance center - head
+    out[:,:,:,0] = out[:,:,:,2] + np.cos( ori ) * disCH[:,np.newaxis]
+    out[:,:,:,1] = out[:,:,:,3] + np.sin( ori ) * disCH[:,np.newaxis]
+
+    out = out.reshape( batch, row + 1, nfish * 4 )
+    return out if batched else out[0]
 
 def updateLocomotions():
     """
-    Update all locomotion files
+    Update all locomotion files listed in data/recordings.csv
     """
-    getLocomotion( extract_coordinates( "data/sleap_1_diff1.h5", [b'head',b'center'], fish_to_extract=[0,1,2]), "data/locomotion_data_diff1.csv" )
-    getLocomotion( extract_coordinates( "data/sleap_1_diff2.h5", [b'head',b'center'], fish_to_extract=[0,1,2]), "data/locomotion_data_diff2.csv" )
-    getLocomotion( extract_coordinates( "data/sleap_1_diff3.h5", [b'head',b'center'], fish_to_extract=[0,1,2])[0:17000], "data/locomotion_data_diff3.csv" )
-    getLocomotion( extract_coordinates( "data/sleap_1_diff4.h5", [b'head',b'center'], fish_to_extract=[0,1,2])[120:], "data/locomotion_data_diff4.csv" )
-    getLocomotion( extract_coordinates( "data/sleap_1_same1.h5", [b'head',b'center'], fish_to_extract=[0,1,2]), "data/locomotion_data_same1.csv" )
-    getLocomotion( extract_coordinates( "data/sleap_1_same3.h5", [b'head',b'center'], fish_to_extract=[0,1,2])[130:], "data/locomotion_data_same3.csv" )
-    getLocomotion( extract_coordinates( "data/sleap_1_same4.h5", [b'head',b'center'], fish_to_extract=[0,1,2]), "data/locomotion_data_same4.csv" )
-    getLocomotion( extract_coordinates( "data/sleap_1_same5.h5", [b'head',b'center'], fish_to_extract=[0,1,2]), "data/locomotion_data_same5.csv" )
+    from preprocessing import preprocess
+    preprocess(steps = ["locomotion"])
 
 def updateLocomotionBin():
     """
-    Update all locomotion_bin files
+    Update all locomotion_bin files listed in data/recordings.csv
     """
-    convertLocmotionToBin(pd.read_csv("data/locomotion_data_diff1.csv", sep = ";").to_numpy(), "data/clusters.txt", "data/locomotion_data_bin_diff1.csv")
-    convertLocmotionToBin(pd.read_csv("data/locomotion_data_diff2.csv", sep = ";").to_numpy(), "data/clusters.txt", "data/locomotion_data_bin_diff2.csv")
-    convertLocmotionToBin(pd.read_csv("data/locomotion_data_diff3.csv", sep = ";").to_numpy(), "data/clusters.txt", "data/locomotion_data_bin_diff3.csv")
-    convertLocmotionToBin(pd.read_csv("data/locomotion_data_diff4.csv", sep = ";").to_numpy(), "data/clusters.txt", "data/locomotion_data_bin_diff4.csv")
-    convertLocmotionToBin(pd.read_csv("data/locomotion_data_same1.csv", sep = ";").to_numpy(), "data/clusters.txt", "data/locomotion_data_bin_same1.csv")
-    convertLocmotionToBin(pd.read_csv("data/locomotion_data_same3.csv", sep = ";").to_numpy(), "data/clusters.txt", "data/locomotion_data_bin_same3.csv")
-    convertLocmotionToBin(pd.read_csv("data/locomotion_data_same4.csv", sep = ";").to_numpy(), "data/clusters.txt", "data/locomotion_data_bin_same4.csv")
-    convertLocmotionToBin(pd.read_csv("data/locomotion_data_same5.csv", sep = ";").to_numpy(), "data/clusters.txt", "data/locomotion_data_bin_same5.csv")
+    from preprocessing import preprocess
+    preprocess(steps = ["bin"])
+
+
+def _angles( x1, y1, x2, y2 ):
+    """
+    Same as getAngles() but with x and y given as separate arrays
+    """
+    return np.arctan2( x1 * y2 - x2 * y1, x1 * x2 + y1 * y2 ) % ( np.pi * 2 )
 
 
 def getnLoc( tracks, nnodes, nfish=3 ):
@@ -204,46 +260,44 @@ def getnLoc( tracks, nnodes, nfish=3 ):
     n:
         Amount of nodes per fish, n >= 2
     output:
+        per fish [center movement, angle of movement, change of orientation,
+        distance and angle of every node but the center to the next center]
         [
             [ori]
         ]
     """
     rows, cols = tracks.shape
-    assert cols >= 4 * nfish
+    assert cols >= 2 * nnodes * nfish
     assert rows > 1
     assert nnodes >= 1
 
     nf = nnodes * 2 + 1 # entries per fish
-    out = np.empty( ( rows - 1, nf * nfish ) )
-    for f in range(nfish):
-        ## Set first 3 entries
-        head_next = tracks[1:,[4 * f, 4 * f + 1]]
-        center_next = tracks[1:,[4 * f + 2, 4 * f + 3]]
-        # head - center
-        vec_look = tracks[:-1,[4 * f, 4 * f + 1]] - tracks[:-1,[4 * f + 2, 4 * f + 3]]
-        # head - center
-        vec_look_next = head_next - center_next
-        # center_next - center
-        vec_next = center_next - tracks[:-1,[4 * f + 2, 4 * f + 3]]
-        out[:,nf * f] = get_distances( tracks[:,[4 * f + 2, 4 * f + 3]] )[:,0]
-        out[:,nf * f + 1] = getAngles( vec_look, vec_next )
-        out[:,nf * f + 2] = getAngles( vec_look, vec_look_next )
-        ## Set every other node in relation to orientation and center node
-        for n in range( nnodes - 1 ):
-            # since head is at the first position...
-            ix = nf * f + 3
-            if n == 0:
-                vec_ch_next = head_next - center_next
-                out[:,ix + 2 * n] = getDistances( center_next, head_next )
-                # Since the new orientation is exactly the angle o the vector between head and center
-                out[:,ix + 2 * n + 1] = 0
-            else:
-                node_next = tracks[1:,[4 * f + 2 + 2 * n, 4 * f + 2 + 2 * n + 1]]
-                vec_cn_next = node_next - center_next
-                out[:,ix + 2 * n] = getDistances( center_next, node_next )
-                out[:,ix + 2 * n + 1] = getAngles( vec_look_next, vec_cn_next )
-
-    return out
+    # x and y planes of the (frames, fish, nodes, xy) view, shape (frames, fish, nodes), no copy
+    view = getTrackView( tracks, nfish, nnodes )
+    x = view[...,0]
+    y = view[...,1]
+    out = np.empty( ( rows - 1, nfish, nf ) )
+    ## Set first 3 entries
+    # head - center
+    look_x = x[:,:,0] - x[:,:,1]
+    look_y = y[:,:,0] - y[:,:,1]
+    # center_next - center
+    next_x = np.diff( x[:,:,1], axis=0 )
+    next_y = np.diff( y[:,:,1], axis=0 )
+    out[:,:,0] = np.hypot( next_x, next_y )
+    out[:,:,1] = _angles( look_x[:-1], look_y[:-1], next_x, next_y )
+    out[:,:,2] = _angles( look_x[:-1], look_y[:-1], look_x[1:], look_y[1:] )
+    ## Set every other node in relation to orientation and center node
+    out[:,:,3] = np.hypot( look_x[1:], look_y[1:] )
+    # Since the new orientation is exactly the angle o the vector between head and center
+    out[:,:,4] = 0
+    # all nodes after the center at once, broadcasted over fish and nodes
+    cn_x = x[1:,:,2:] - x[1:,:,1:2]
+    cn_y = y[1:,:,2:] - y[1:,:,1:2]
+    out[:,:,5::2] = np.hypot( cn_x, cn_y )
+    out[:,:,6::2] = _angles( look_x[1:,:,np.newaxis], look_y[1:,:,np.newaxis], cn_x, cn_y )
+
+    return out.reshape( rows - 1, nfish * nf )
 
 
 def main():
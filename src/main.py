@@ -6,6 +6,7 @@ from tensorflow.keras.optimizers import RMSprop
 from tensorflow.keras.models import Sequential, load_model
 from tensorflow.keras.layers import Dense, LSTM, BatchNormalization, Dropout
 from itertools import chain
+from nmodel import getStateful, getDatasets
 import reader
 import tensorflow as tf
 import pandas as pd
@@ -17,9 +18,10 @@ import shap
 # Use python 3.6.10
 
 class Simulation:
-    def __init__(self, count_bins_agents, count_rays_walls, radius_fov_walls, radius_fov_agents, max_view_range, count_fishes, cluster_path, verbose = 1):
+    def __init__(self, count_bins_agents, count_rays_walls, radius_fov_walls, radius_fov_agents, max_view_range, count_fishes, cluster_path, verbose = 1, wall_table = None):
         """
         self._cluster does not work properly right now, dont use!!!!
+        wall_table: path to a precomputed WallRayTable used for the wall rays in testNetwork (computed and saved there if missing), exact wall rays if None
         """
         self._count_bins = count_bins_agents
         self._count_rays = count_rays_walls
@@ -34,7 +36,8 @@ class Simulation:
             self._clusters_path = cluster_path
             self._clusters_mov, self._clusters_pos, self._clusters_ori = readClusters(cluster_path)
             self._clusters_counts = len(self._clusters_mov), len(self._clusters_pos), len(self._clusters_ori)
-        self._wall_lines = defineLines(getRedPoints(path = "data/final_redpoint_wall.jpg"))
+        self._wall_lines = getWallLines(path = "data/final_redpoint_wall.jpg")
+        self._wall_table = None if wall_table is None else getWallTable(self._wall_lines, max_view_range, path = wall_table)
         self._tracks = []
         self.verbose = verbose
         self._mean = []
@@ -59,8 +62,13 @@ class Simulation:
         shap.summary_plot(shap_values, self._tracks[0], plot_type = "bar")
 
     def trainNetworkOnce(self, locomotion_paths, raycast_paths, batch_size, sequence_length, epochs):
-        x_train_data_all, y_train_data_all = None, None
-        x_val_data_all, y_val_data_all = None, None
+        """
+        trains the Network on all given files at once, the trajectories of all fish are kept one after another in one array
+        and windows of sequence_length frames are gathered per batch from the window ends (see nmodel.windowDataset)
+        """
+        trajectories = []
+        train_ends, val_ends = [], []
+        offset = 0
 
         for i in range(0, len(locomotion_paths)):
             #get locomotion
@@ -68,8 +76,8 @@ class Simulation:
             locomotion = df.to_numpy()
 
             #get raycasts (we dont need the first raycast cause it does not have a last locomotion)
-            df = pd.read_csv(raycast_paths[i], sep = ";")
-            raycasts = df.to_numpy()[1:]
+            raycasts, _ = readRays(raycast_paths[i])
+            raycasts = raycasts[1:]
 
             loc_size = 3
 
@@ -88,36 +96,29 @@ class Simulation:
                     self._std = trajectory[:TRAIN_SPLIT].std(axis = 0)
                 trajectory = (trajectory - self._mean) / self._std
 
-                #create sequences
-                x_train, y_train = multivariate_data(trajectory, trajectory[:, 0:3], 0, TRAIN_SPLIT, sequence_length, 1, 1, single_step = True)
-                x_val, y_val = multivariate_data(trajectory, trajectory[:, 0:3], TRAIN_SPLIT, None, sequence_length, 1, 1, single_step = True)
+                #window ends of the sequences multivariate_data would create, the window before an end predicts the locomotion one frame after it
+                train_ends.append(offset + np.arange(sequence_length, TRAIN_SPLIT))
+                val_ends.append(offset + np.arange(TRAIN_SPLIT + sequence_length, len(trajectory) - 1))
+                trajectories.append(trajectory)
+                offset += len(trajectory)
 
-                #append it all together (from all paths)
-                if i == 0 and j == 0:
-                    x_train_data_all, y_train_data_all = x_train, y_train
-                    x_val_data_all, y_val_data_all = x_val, y_val
-                else:
-                    x_train_data_all, y_train_data_all = np.append(x_train_data_all, x_train, axis = 0), np.append(y_train_data_all, y_train, axis = 0)
-                    x_val_data_all, y_val_data_all = np.append(x_val_data_all, x_val, axis = 0), np.append(y_val_data_all, y_val, axis = 0)
+        data = np.concatenate(trajectories)
+        train_ends, val_ends = np.concatenate(train_ends), np.concatenate(val_ends)
 
         #save startpositions for use in testNetwork
         for i in range(0, 100):
-            rand = random.randrange(0, x_train_data_all.shape[0]-1)
-            self._start_simulation.append(x_train_data_all[rand:rand+1])
+            rand = random.randrange(0, len(train_ends)-1)
+            self._start_simulation.append(getWindows(data, train_ends[rand:rand+1], sequence_length))
 
-        #make repeating tensor object
-        train_data = tf.data.Dataset.from_tensor_slices((x_train_data_all, y_train_data_all))
-        train_data = train_data.cache().shuffle(10000).batch(batch_size).repeat()
-
-        val_data = tf.data.Dataset.from_tensor_slices((x_val_data_all, y_val_data_all))
-        val_data = val_data.batch(batch_size).repeat()
+        #make repeating tensor objects
+        train_data, val_data = getDatasets(data, data[:, 0:3], train_ends, val_ends, sequence_length, 1, batch_size, 10000)
 
         #train
         if self.verbose >= 2:
-            history = self._model.fit(train_data, epochs = epochs, steps_per_epoch = len(x_train_data_all) // batch_size, validation_data = val_data, validation_steps = 50, verbose = 1)
+            history = self._model.fit(train_data, epochs = epochs, steps_per_epoch = len(train_ends) // batch_size, validation_data = val_data, validation_steps = 50, verbose = 1)
             plot_train_history(history, "Training and validation loss")
         else:
-            history = self._model.fit(train_data, epochs = epochs, steps_per_epoch = len(x_train_data_all) // batch_size, validation_data = val_data, validation_steps = 50, verbose = 0)
+            history = self._model.fit(train_data, epochs = epochs, steps_per_epoch = len(train_ends) // batch_size, validation_data = val_data, validation_steps = 50, verbose = 0)
             plot_train_history(history, "Training and validation loss")
             
 
@@ -137,8 +138,7 @@ class Simulation:
             loc_size = 3
         locomotion = df.to_numpy()
 
-        df = pd.read_csv(raycasts_path, sep = ";")
-        raycasts = df.to_numpy()
+        raycasts, _ = readRays(raycasts_path)
 
         if self.verbose >= 1:
             print("Started training on " + locomotion_path[-9:-4])
@@ -181,10 +181,11 @@ class Simulation:
             else:
                 self._model.fit(train_data, epochs = epochs, steps_per_epoch = len(x_train) // batch_size, validation_data = val_data, validation_steps = 50, verbose = 0)
 
-    def testNetwork(self, timesteps = 10, save_tracks = None, save_start = None, start = "random", seed = None):
+    def testNetwork(self, timesteps = 10, save_tracks = None, save_start = None, start = "random", seed = None, stateful = False):
         """
         creates a Simulation for the network and created locomotions for timesteps times
         the starting position of each fish is random (if start = "random")
+        stateful: carry the LSTM state from step to step (see nmodel.StatefulRollout) instead of re-running the shifted window
         self._cluster does not work properly right now, dont use!!!!
         """
         out_of_tank = 0
@@ -192,10 +193,11 @@ class Simulation:
         first_pos = None
         tracks_header = np.array([list(chain.from_iterable(("Fish_" + str(i) + "_linear_movement", "Fish_" + str(i) + "_angle_new_pos", "Fish_" + str(i) + "_angle_change_orientation") for i in range(0, self._count_agents)))])
         tracks = np.empty((timesteps, tracks_header.shape[1]))
-        cur_X = [[] for i in range(0, self._count_agents)]
+        cur_X = [None for i in range(0, self._count_agents)]
         cur_pos = []
         locomotion = [[] for i in range(0, self._count_agents)]
         raycast_object = Raycast(self._wall_lines, self._count_bins, self._count_rays, self._fov_agents, self._fov_walls, self._view, self._count_agents)
+        raycast_object.setWallTable(self._wall_table)
         if start == "random":
             start_indices = None
             start_indices = random.sample(range(len(self._start_simulation)), 3)
@@ -204,10 +206,20 @@ class Simulation:
                 x_center, y_center, length, angle_rad = random.uniform(250, 700), random.uniform(125, 550), random.uniform(10,30), math.radians(random.uniform(0, 359))
                 #cur_pos right now is x_head, y_head, length angle from look_vector to pos_x_axis
                 cur_pos.append([x_center, y_center, length, angle_rad])
-                cur_X[i] = self._start_simulation[start_indices[i]]
+                #standardized history of the last sequence_length observations, updated in place every step
+                cur_X[i] = HistoryBuffer((self._start_simulation[start_indices[i]][0] - self._mean) / self._std)
                
 
         first_pos = [[cur_pos[i][j] for j in range(0, len(cur_pos[i]))] for i in range(0, len(cur_pos))]
+        #preallocated per step buffers
+        input_raycasts = np.empty((1, self._count_agents*4))
+        new_X = np.empty(cur_X[0].view().shape[1])
+        loc_size = new_X.shape[0] - self._count_rays - self._count_bins
+
+        if stateful:
+            rollout = getStateful(self._model, self._count_agents)
+            #encode the start windows once, without their newest observation which is fed by the first step
+            rollout.warmup(np.stack([cur_X[j].view()[:-1] for j in range(0, self._count_agents)]))
 
         for i in range(0, timesteps):
             if i!=0 and i%1000 == 0 and self.verbose >= 1:
@@ -215,8 +227,13 @@ class Simulation:
             new_row = None
 
             #get next step
+            if stateful:
+                preds = rollout.step(np.stack([cur_X[j].view()[-1] for j in range(0, self._count_agents)]))
             for j in range(0, self._count_agents):
-                pred = self._model.predict((cur_X[j]-self._mean) / self._std)
+                if stateful:
+                    pred = preds[j:j+1]
+                else:
+                    pred = self._model.predict(cur_X[j].view()[np.newaxis])
                 #revert standardization
                 pred = pred * self._mean[0:3].reshape(1, 3) + self._std[0:3].reshape(1, 3)
                 pred_mov, pred_pos, pred_ori = None, None, None
@@ -298,21 +315,20 @@ class Simulation:
             tracks[i] = new_row
 
             #get Raycasts
-            input_raycasts = [None for j in range(0, self._count_agents)]
             for j in range(0, self._count_agents):
-                input_raycasts[j] = [cur_pos[j][0] + cur_pos[j][2]*math.cos(cur_pos[j][3]), cur_pos[j][1] + cur_pos[j][2]*math.sin(cur_pos[j][3]), cur_pos[j][0], cur_pos[j][1]]
-            input_raycasts = np.array(input_raycasts).reshape(1, self._count_agents*4)
+                input_raycasts[0, j*4 : (j+1)*4] = cur_pos[j][0] + cur_pos[j][2]*math.cos(cur_pos[j][3]), cur_pos[j][1] + cur_pos[j][2]*math.sin(cur_pos[j][3]), cur_pos[j][0], cur_pos[j][1]
 
-            temp_X = [None for j in range(0, self._count_agents)]
             raycasts = raycast_object.getRays(input_raycasts)
             for j in range(0, self._count_agents):
-                temp_X[j] = np.append(np.append(locomotion[j], raycasts[:, j*self._count_rays : (j+1)*self._count_rays], axis = 1), raycasts[:, self._count_agents*self._count_rays+j*self._count_bins : self._count_agents*self._count_rays+(j+1)*self._count_bins])
-                temp_X[j] = temp_X[j].reshape(1, 1, temp_X[j].shape[0])
-                temp_X[j] = temp_X[j].astype(np.float)
-                #remove oldest observation
-                cur_X[j] = np.delete(cur_X[j], 0, axis = 1)
-                #append latest observation
-                cur_X[j] = np.append(cur_X[j], temp_X[j], axis = 1)
+                #write latest observation into its slot: locomotion, then agent bins and wall rays of fish j, the order used in training
+                #(getRays puts the agent bins of all fish before their wall rays, see getHeader; the slices below only match that for count_bins == count_rays)
+                new_X[:loc_size] = locomotion[j][0]
+                new_X[loc_size : loc_size+self._count_rays] = raycasts[0, j*self._count_rays : (j+1)*self._count_rays]
+                new_X[loc_size+self._count_rays:] = raycasts[0, self._count_agents*self._count_rays+j*self._count_bins : self._count_agents*self._count_rays+(j+1)*self._count_bins]
+                np.subtract(new_X, self._mean, out = new_X)
+                np.divide(new_X, self._std, out = new_X)
+                #replaces oldest observation
+                cur_X[j].append(new_X)
 
         if self.verbose >= 1:
             print("fish tried to move " + str(out_of_tank) + " times out tank")
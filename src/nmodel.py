@@ -6,64 +6,19 @@ import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers
 
-from functions import getDistances, getAngles, getDistance, getAngle, defineLines, getRedPoints
+from functions import getTrackView, multivariate_data, getWindows, RunningMeanStd
 from reader import extract_coordinates
-from locomotion import getnLoc, row_l2c, row_l2c_additional_nodes, row_l2c_additional_nodes
+from locomotion import getnLoc
 from evaluation import plot_train_history
-from raycasts import Raycast
-
-def getnView( tracksFish, tracksOther, nfish=3 ):
-    """
-    Input: tracks from protagonist fish, only [head,center] expected
-    Output gives distances to all nodes from other fishes in tracks
-    nfish total amount of fish (fish in tracksOther + 1)
-    """
-    rows, cols = tracksFish.shape
-    rows2, cols2 = tracksOther.shape
-    assert rows == rows2
-    assert rows > 1
-    assert cols == 4
-    nnodes = cols2 // (nfish - 1) // 2
-
-    out = np.empty( ( rows, nnodes * (nfish-1) * 2 ) )
-    center = tracksFish[:,[2,3]]
-    # 1. Head - Center
-    vec_ch = tracksFish[:,[0,1]] - center
-    # 2. compute values for every fish and node
-    for f in range( nfish - 1 ):
-        for n in range( nnodes ):
-            ixy = [2 * nnodes * f + 2 * n, 2 * nnodes * f + 2 * n + 1]
-            # node - center
-            vec_cn = tracksOther[:,ixy] - center
-            out[:,nnodes * 2 * f + 2 * n] = getDistances( tracksOther[:,ixy], center )
-            out[:,nnodes * 2 * f + 2 * n + 1] = getAngles( vec_ch, vec_cn )
-
-    return out
-
-def getnViewSingle( posFish, posOther, nnodes, nfish=3 ):
-    """
-    Same as above but for one row
-    """
-    center = np.array( posFish[2:4] )
-    head = np.array( posFish[0:2] )
-    vec_ch = head - center
-    out = np.empty( ( nnodes * (nfish - 1) * 2 ) )
-    for f in range( nfish - 1 ):
-        for n in range( nnodes ):
-            ixy = [2 * nnodes * f + 2 * n, 2 * nnodes * f + 2 * n + 1]
-            # node - center
-            vec_cn = posOther[ixy] - center
-            out[nnodes * 2 * f + 2 * n] = getDistance( (posOther[ixy])[0], (posOther[ixy])[1], center[0], center[1] )
-            out[nnodes * 2 * f + 2 * n + 1] = getAngle( vec_ch, vec_cn, "radians" )
-    return out
-
+from raycasts import readRays
+from simulation import getnView, getnViewSingle, getnViewAll, simulate
 
 def stealWallRays( path, COUNT_RAYS_WALLS=15, nfish=3 ):
     """
     Steals wall rays from raycast data
     """
-    raycasts = pd.read_csv( path, sep = ";" ).to_numpy()
-    return raycasts[:,-15 * nfish:]
+    raycasts, _ = readRays( path )
+    return raycasts[:,-COUNT_RAYS_WALLS * nfish:]
 
 
 def createModel( name, U_LSTM, U_DENSE, U_OUT, input_shape, dropout=None ):
@@ -85,32 +40,65 @@ def createModel( name, U_LSTM, U_DENSE, U_OUT, input_shape, dropout=None ):
     return nmodel
 
 
-def multivariate_data( dataset, target, start_index, end_index, history_size, target_size, step, single_step=False ):
+def createStatefulModel( model, batch_size ):
     """
-    Taken from https://www.tensorflow.org/tutorials/structured_data/time_series
+    Converts a model of createModel into a stateful model for single step inference,
+    the LSTM keeps its state between calls, Dropout layers are left out (no-op in inference)
     """
-    data = []
-    labels = []
+    assert isinstance( model.layers[0], tf.keras.layers.LSTM )
+    smodel = tf.keras.models.Sequential( name=model.name + "_stateful" )
+    for layer in model.layers:
+        if isinstance( layer, tf.keras.layers.Dropout ):
+            continue
+        config = layer.get_config()
+        if isinstance( layer, tf.keras.layers.LSTM ):
+            config["stateful"] = True
+            config["batch_input_shape"] = ( batch_size, None, layer.input_shape[-1] )
+        smodel.add( layer.__class__.from_config( config ) )
+    smodel.set_weights( model.get_weights() )
+    return smodel
+
+
+class StatefulRollout:
+    """
+    Rollout with a stateful copy of a model of createModel, one sequence per batch entry:
+    warmup() encodes the start windows once, step() then advances every sequence by one frame
+    instead of re-running the LSTM over the whole shifted window
+    """
+    def __init__( self, model, batch_size ):
+        self.model = createStatefulModel( model, batch_size )
+        self._call = tf.function( lambda x: self.model( x, training=False ) )
 
-    start_index = start_index + history_size
-    if end_index is None:
-        end_index = len( dataset ) - target_size
+    def warmup( self, windows ):
+        """
+        Resets the state and runs the windows (batch, frames, D_DATA), returns the prediction after the last frame
+        """
+        self.model.reset_states()
+        return self._call( tf.convert_to_tensor( windows, dtype=tf.float32 ) ).numpy()
 
-    for i in range( start_index, end_index ):
-        indices = range( i - history_size, i, step )
-        data.append( dataset[indices] )
+    def step( self, inp ):
+        """
+        Advances all sequences by the frames inp (batch, D_DATA), returns the predictions (batch, D_OUT)
+        """
+        return self._call( tf.convert_to_tensor( inp[:,np.newaxis], dtype=tf.float32 ) ).numpy()
 
-        if single_step:
-            labels.append( target[i + target_size] )
-        else:
-            labels.append( target[i:i + target_size] )
 
-    return np.array( data ), np.array( labels )
+def getStateful( model, batch_size ):
+    """
+    StatefulRollout for keras models, anything else is expected to have warmup() and step() already
+    """
+    if not isinstance( model, tf.keras.Model ):
+        return model
+    return StatefulRollout( model, batch_size )
 
 
 def loadData( pathsTracksets, pathsRaycasts, nodes, nfish, N_WRAYS, N_VIEWS, D_LOC, D_DATA, D_OUT, HIST_SIZE, TARGET_SIZE, mean, SPLIT=0.9, getmean=False, pathToSave=None ):
     """
     pathsTrackset and pathsRaycast need to be in same order
+    Windows are not materialized, returns the features of all files and fish stacked as one array:
+    data, target, train_ends, val_ends
+    sample i is data[train_ends[i] - HIST_SIZE:train_ends[i]] with label target[train_ends[i] + TARGET_SIZE],
+    see getDatasets() and getWindows()
     """
     assert len( pathsTracksets ) == len( pathsRaycasts )
     nnodes = len( nodes )
@@ -129,12 +117,14 @@ def loadData( pathsTracksets, pathsRaycasts, nodes, nfish, N_WRAYS, N_VIEWS, D_L
         print( stdTGT )
 
     # Load tracks and raycasts in
-    x_data_train = []
-    y_data_train = []
-    x_data_val = []
-    y_data_val = []
-    totaldataset = []
-    targetdataset = []
+    data = []
+    target = []
+    train_ends = []
+    val_ends = []
+    offset = 0
+    # for mean and std calculation
+    statsData = RunningMeanStd( D_DATA )
+    statsTarget = RunningMeanStd( D_LOC )
     for i in range( len( pathsTracksets ) ):
         if pathsTracksets[i] == "data/sleap_1_same3.h5":
             tracks = extract_coordinates( pathsTracksets[i], nodes, [x for x in range(nfish)] )[130:]
@@ -142,20 +132,17 @@ def loadData( pathsTracksets, pathsRaycasts, nodes, nfish, N_WRAYS, N_VIEWS, D_L
             tracks = extract_coordinates( pathsTracksets[i], nodes, [x for x in range(nfish)] )
         wRays = stealWallRays( pathsRaycasts[i], COUNT_RAYS_WALLS=N_WRAYS, nfish=nfish )
         nLoc = getnLoc( tracks, nnodes=nnodes, nfish=nfish )
+        # view of every fish on the others, (frames, fish, N_VIEWS)
+        nView = getnViewAll( getTrackView( tracks, nfish, nnodes ), nfish, nnodes )
         splitindex = int( tracks.shape[0] * SPLIT )
         for f in range( nfish ):
             fdataset = np.empty( ( tracks.shape[0], D_DATA ) )
             # View
-            track_indices_ch = [f * nnodes * 2, f * nnodes * 2 + 1, f * nnodes * 2 + 2, f * nnodes * 2 + 3]
-            track_iSubtract = [x + nnodes * 2 * f for x in range( nnodes * 2 )]
-            track_indices_otherFish = [x for x in range( nnodes * nfish * 2 ) if x not in track_iSubtract]
-            fnView = getnView( tracks[:,track_indices_ch], tracks[:,track_indices_otherFish], nfish = nfish )
+            fnView = nView[:,f]
             # RayCasts
-            wRays_indices_fish = [f * N_WRAYS + x for x in range( N_WRAYS )]
-            fwrays = wRays[:,wRays_indices_fish]
+            fwrays = wRays[:,f * N_WRAYS:( f + 1 ) * N_WRAYS]
             # Locomotion
-            nLoc_indices = [f * ( nnodes * 2 + 1 ) + x for x in range( nnodes * 2 + 1 )]
-            fnLoc = nLoc[:,nLoc_indices]
+            fnLoc = nLoc[:,f * ( nnodes * 2 + 1 ):( f + 1 ) * ( nnodes * 2 + 1 )]
             # Merge to dataset
             fdataset[:,:N_VIEWS] = fnView
             fdataset[:,N_VIEWS:-D_LOC] = fwrays
@@ -170,168 +157,91 @@ def loadData( pathsTracksets, pathsRaycasts, nodes, nfish, N_WRAYS, N_VIEWS, D_L
                 fdataset = np.nan_to_num( ( fdataset - meanv ) / std )
                 ftarget = np.nan_to_num( ( ftarget - meanTGT ) / stdTGT )
 
-            x_train, y_train = multivariate_data( fdataset, ftarget, 0, splitindex, HIST_SIZE, TARGET_SIZE, 1, single_step=True )
-            x_data_train.append( x_train )
-            y_data_train.append( y_train )
-
-            x_val, y_val = multivariate_data( fdataset, ftarget, splitindex, None, HIST_SIZE, TARGET_SIZE, 1, single_step=True )
-            x_data_val.append( x_val )
-            y_data_val.append( y_val )
+            # same samples as multivariate_data( fdataset, ftarget, 0, splitindex, ... ) and ( splitindex, None )
+            data.append( fdataset.astype( np.float32 ) )
+            target.append( ftarget.astype( np.float32 ) )
+            train_ends.append( offset + np.arange( HIST_SIZE, splitindex ) )
+            val_ends.append( offset + np.arange( splitindex + HIST_SIZE, len( fdataset ) - TARGET_SIZE ) )
+            offset += len( fdataset )
 
             if getmean:
-                totaldataset.append( np.array( fdataset[:splitindex] ) ) # for mean and std calculation
-                targetdataset.append( np.array( ftarget[:splitindex] ) )
+                statsData.update( fdataset[:splitindex] )
+                statsTarget.update( ftarget[:splitindex] )
 
     if getmean:
-        totaldataset = np.concatenate( totaldataset, axis=0 )
-        meanv = totaldataset.mean( axis=0 )
-        std = totaldataset.std( axis=0 )
+        meanv = statsData.mean
+        std = statsData.std
 
         print( "mean   :" )
         print( meanv )
         print( "std    :" )
         print( std )
 
-        targetdataset = np.concatenate( targetdataset, axis=0 )
-        meanTGT = targetdataset.mean( axis=0 )
-        stdTGT = targetdataset.std( axis=0 )
+        meanTGT = statsTarget.mean
+        stdTGT = statsTarget.std
 
         print( "meanTGT:" )
         print( meanTGT )
         print( "stTGT  :" )
         print( stdTGT )
 
-        np.save( pathToSave, np.array( [meanv, std, meanTGT, stdTGT] ) )
+        saveMean( pathToSave, statsData, statsTarget )
 
-    x_data_train = np.concatenate( x_data_train, axis=0 )
-    y_data_train = np.concatenate( y_data_train, axis=0 )
-    x_data_val = np.concatenate( x_data_val, axis=0 )
-    y_data_val = np.concatenate( y_data_val, axis=0 )
+    data = np.concatenate( data, axis=0 )
+    target = np.concatenate( target, axis=0 )
+    train_ends = np.concatenate( train_ends )
+    val_ends = np.concatenate( val_ends )
 
-    return x_data_train, y_data_train, x_data_val, y_data_val
+    return data, target, train_ends, val_ends
 
 
-def simulate( model, nnodes, nfish, startinput, startpos, startloc, timesteps, N_VIEWS, D_LOC, N_WRAYS, FOV_WALLS, MAX_VIEW_RANGE, mean ):
+def saveMean( path, statsData, statsTarget ):
     """
-    returns positions of nodes, then polar position of center, then nLoc of predictions
-    startpos and startloc are not standardized
+    Saves [mean, std, meanTGT, stdTGT] of two RunningMeanStd, as read by loadData( mean=path ) and simulate,
+    accumulators of several workers can be merged before
     """
-    assert len( startpos ) == nnodes * 2 * nfish
-    assert startinput.shape[-1] == D_LOC + N_VIEWS + N_WRAYS
-    assert nnodes >= 2
-
-    if mean is not None:
-        arr = np.load( mean, allow_pickle=True )
-        meanv = arr[0]
-        std = arr[1]
-        meanTGT = arr[2]
-        stdTGT = arr[3]
-        print( "Using mean and std:")
-        print( meanv )
-        print( std )
-        print( "Using mean and std for target:" )
-        print( meanTGT )
-        print( stdTGT )
-
-    nLoc = np.empty( ( timesteps, (nnodes * 2 + 1) * nfish ) )
-    pos = np.empty( ( timesteps + 1, nnodes * 2 * nfish ) ) # saves x, y val for every node
-    posCenterPolar = np.empty( (timesteps + 1, 3 * nfish ) ) # saves c_x, c_y, orienation
-    # Initialize first row
-    modelinput = startinput
-    pos[0] = startpos
-    for f in range(nfish):
-        posCenterPolar[0, 3 * f] = startpos[nnodes * 2 * f + 2]
-        posCenterPolar[0, 3 * f + 1] = startpos[nnodes * 2 * f + 3]
-        # Angle between Fish Orientation and the unit vector
-        # Head - Center
-        x = ( startpos[nnodes * 2 * f] - startpos[nnodes * 2 * f + 2] )
-        y = ( startpos[nnodes * 2 * f + 1] - startpos[nnodes * 2 * f + 3] )
-        posCenterPolar[0, 3 * f + 2] = getAngle( ( 1, 0 ), ( x, y ), "radians" )
-
-    # MARCS RAYCAST OBJECT
-    walllines = defineLines( getRedPoints(path = "data/final_redpoint_wall.jpg") )
-    unnecessary = 10
-    raycast_object = Raycast( walllines, unnecessary, N_WRAYS, unnecessary, FOV_WALLS, MAX_VIEW_RANGE, nfish )
-
-    # main loop
-    for t in range( timesteps ):
-        if t % 500 == 0:
-            print( "Frame {:6}".format( t ) )
-        for f in range( nfish ):
-            # 1. Compute input for fish
-            # 2. Compute prediction
-            # 3. Compute new positions
-
-            # 1. Input for fish
-            inp = np.empty( (N_VIEWS + N_WRAYS + D_LOC) )
-
-            # nView
-            pos_indices_ch = [f * nnodes * 2, f * nnodes * 2 + 1, f * nnodes * 2 + 2, f * nnodes * 2 + 3]
-            pos_iSubtract = [x + nnodes * 2 * f for x in range( nnodes * 2 )]
-            pos_indices_otherFish = [x for x in range( nnodes * nfish * 2 ) if x not in pos_iSubtract]
-            inp[:N_VIEWS] = getnViewSingle( pos[t,pos_indices_ch], pos[t,pos_indices_otherFish], nnodes=nnodes, nfish = nfish )
-
-            # wRays
-            pos_ind_center = [f * nnodes * 2 + 2, f * nnodes * 2 + 3]
-            pos_ind_head = [f * nnodes * 2, f * nnodes * 2 + 1]
-            fcenter = pos[t,pos_ind_center]
-            fhead = pos[t,pos_ind_head]
-            vec_ch = fhead - fcenter
-            inp[N_VIEWS:-D_LOC] = raycast_object._getWallRays( fcenter, vec_ch )
-
-            # nLoc
-            loc_ind = [f * D_LOC + x for x in range(D_LOC)]
-            if t == 0:
-                inp[-D_LOC:] = np.array( startloc )[loc_ind]
-            else:
-                inp[-D_LOC:] = nLoc[t - 1, loc_ind]
-
-            if mean is not None:
-                inp = np.nan_to_num( ( inp - meanv ) / std )
-
-            # 2. Prediction
-            # Shift all observations
-            modelinput[:-1] = modelinput[1:]
-            # Insert newest
-            modelinput[-1] = inp
-            prediction = model.predict( np.array( [modelinput] ) )
+    arr = np.empty( 4, dtype=object )
+    arr[:] = [statsData.mean, statsData.std, statsTarget.mean, statsTarget.std]
+    np.save( path, arr )
 
-            if mean is not None:
-                # shift prediction back
-                prediction = prediction * stdTGT + meanTGT
-
-            # prediction = model[t,loc_ind] # to test correcness of simulation insert a loc file as model
-            nLoc[t, loc_ind] = prediction
 
-            # 3. New positions
+def getForward( model ):
+    """
+    Returns a function mapping a batch of windows (batch, HIST_SIZE, D_DATA) to predictions (batch, D_OUT)
+    For keras models the call is compiled once with tf.function, which avoids the overhead of model.predict
+    on every step, anything else is expected to be such a function already
+    """
+    if not isinstance( model, tf.keras.Model ):
+        return model
+    forward = tf.function( lambda x: model( x, training=False ) )
+    return lambda x: forward( tf.convert_to_tensor( x, dtype=tf.float32 ) ).numpy()
 
-            # 3.1 new center position
-            loc_ind_linAngTurn = [f * D_LOC, f * D_LOC + 1, f * D_LOC + 2]
-            pos_ind_xyOri = [f * 3, f * 3 + 1, f * 3 + 2]
-            posCenterPolar[t + 1, pos_ind_xyOri] = row_l2c( posCenterPolar[t, pos_ind_xyOri], nLoc[t, loc_ind_linAngTurn] )
 
-            # 3.2 all the other positions
-            pred_ind_otherNodes = [ 3 + x for x in range( (nnodes - 1 ) * 2 ) ]
-            pos[t + 1, pos_ind_center] = posCenterPolar[t + 1,[f * 3, f * 3 + 1]]
-            output = row_l2c_additional_nodes( posCenterPolar[t + 1,pos_ind_xyOri], prediction[0][pred_ind_otherNodes] )
+def windowDataset( data, target, ends, HIST_SIZE, TARGET_SIZE, BATCH_SIZE, BUFFER_SIZE=None ):
+    """
+    tf.data pipeline over the output of loadData(), windows are gathered per batch
+    from data, so only the raw features are kept in memory
+    """
+    data = tf.constant( data )
+    target = tf.constant( target )
+    offsets = tf.range( -HIST_SIZE, 0, dtype=tf.int64 )
 
-            pos[t + 1, pos_ind_head] = output[0:2]
-            pos_ind_otherNodes = [nnodes * 2 * f + 4 + x for x in range( ( nnodes - 2 ) * 2 )]
-            pos[t + 1, pos_ind_otherNodes] = output[2:]
+    def gather( batch_ends ):
+        return tf.gather( data, batch_ends[:,tf.newaxis] + offsets ), tf.gather( target, batch_ends + TARGET_SIZE )
 
-    return pos, posCenterPolar, nLoc
+    dataset = tf.data.Dataset.from_tensor_slices( np.asarray( ends, dtype=np.int64 ) )
+    if BUFFER_SIZE is not None:
+        dataset = dataset.shuffle( BUFFER_SIZE )
+    return dataset.batch( BATCH_SIZE ).map( gather, num_parallel_calls=tf.data.experimental.AUTOTUNE ).prefetch( 1 )
 
 
-def getDatasets( x_train, y_train, x_val, y_val, BATCH_SIZE, BUFFER_SIZE ):
+def getDatasets( data, target, train_ends, val_ends, HIST_SIZE, TARGET_SIZE, BATCH_SIZE, BUFFER_SIZE ):
     """
     Train the network
     """
     # Put data into datasets
-    train_data = tf.data.Dataset.from_tensor_slices( ( x_train, y_train ) )
-    train_data = train_data.cache().shuffle( BUFFER_SIZE ).batch( BATCH_SIZE ).repeat()
-
-    val_data = tf.data.Dataset.from_tensor_slices( ( x_val, y_val ) )
-    val_data = val_data.batch( BATCH_SIZE ).repeat()
+    train_data = windowDataset( data, target, train_ends, HIST_SIZE, TARGET_SIZE, BATCH_SIZE, BUFFER_SIZE ).repeat()
+    val_data = windowDataset( data, target, val_ends, HIST_SIZE, TARGET_SIZE, BATCH_SIZE ).repeat()
 
     return train_data, val_data
 
@@ -376,20 +286,17 @@ def loadStartData( path, pathRaycast, nodes, nfish, HIST_SIZE,TARGET_SIZE, N_WRA
     tracks = extract_coordinates( path, nodes, [x for x in range(nfish)] )
     nLoc = getnLoc( tracks, nnodes=nnodes, nfish=nfish )
     wRays = stealWallRays( pathRaycast, COUNT_RAYS_WALLS=N_WRAYS, nfish=nfish )
+    # view of every fish on the others, (frames, fish, N_VIEWS)
+    nView = getnViewAll( getTrackView( tracks, nfish, nnodes ), nfish, nnodes )
 
     for f in range( nfish ):
         fdataset = np.empty( ( tracks.shape[0], D_DATA ) )
         # View
-        track_indices_ch = [f * nnodes * 2, f * nnodes * 2 + 1, f * nnodes * 2 + 2, f * nnodes * 2 + 3]
-        track_iSubtract = [x + nnodes * 2 * f for x in range( nnodes * 2 )]
-        track_indices_otherFish = [x for x in range( nnodes * nfish * 2 ) if x not in track_iSubtract]
-        fnView = getnView( tracks[:,track_indices_ch], tracks[:,track_indices_otherFish], nfish = nfish )
+        fnView = nView[:,f]
         # RayCasts
-        wRays_indices_fish = [f * N_WRAYS + x for x in range( N_WRAYS )]
-        fwrays = wRays[:,wRays_indices_fish]
+        fwrays = wRays[:,f * N_WRAYS:( f + 1 ) * N_WRAYS]
         # Locomotion
-        nLoc_indices = [f * ( nnodes * 2 + 1 ) + x for x in range( nnodes * 2 + 1 )]
-        fnLoc = nLoc[:,nLoc_indices]
+        fnLoc = nLoc[:,f * ( nnodes * 2 + 1 ):( f + 1 ) * ( nnodes * 2 + 1 )]
         # Merge to dataset
         fdataset[:,:N_VIEWS] = fnView
         fdataset[:,N_VIEWS:-D_LOC] = fwrays
@@ -407,12 +314,15 @@ def loadStartData( path, pathRaycast, nodes, nfish, HIST_SIZE,TARGET_SIZE, N_WRA
         x_train, y_train = multivariate_data( fdataset, ftarget, 0, None, HIST_SIZE, TARGET_SIZE, 1, single_step=True )
         x_data_train.append( x_train )
 
-    x_data_train = np.concatenate( x_data_train, axis=0 )
     if notrandom is None:
-        thatoneisit = np.random.randint( 0,x_data_train.shape[-1] )
-        return x_data_train[thatoneisit], tracks[thatoneisit * HIST_SIZE], nLoc[thatoneisit * HIST_SIZE]
-
-    return x_data_train[notrandom], tracks[notrandom * HIST_SIZE], nLoc[notrandom * HIST_SIZE]
+        notrandom = np.random.randint( 0, D_DATA )
+    # index into the windows of all fish one after another, without concatenating them
+    i = notrandom
+    for x_train in x_data_train:
+        if i < len( x_train ):
+            return np.array( x_train[i] ), tracks[notrandom * HIST_SIZE], nLoc[notrandom * HIST_SIZE]
+        i -= len( x_train )
+    raise IndexError( "start sequence {} out of range".format( notrandom ) )
 
 
 def main():
@@ -462,18 +372,18 @@ def main():
         pathsTracksets = [same1,same3,same4,same5]
         pathsRaycasts = [same1rays,same3rays,same4rays,same5rays]
 
-        x_train, y_train, x_val, y_val = loadData( pathsTracksets, pathsRaycasts, nodes=[b'head', b'center', b'tail_basis', b'tail_end'], nfish=3, N_WRAYS=N_WRAYS, N_VIEWS=N_VIEWS, D_LOC=D_LOC, D_DATA=D_DATA, D_OUT=D_OUT, SPLIT=SPLIT, HIST_SIZE=HIST_SIZE, TARGET_SIZE=TARGET_SIZE, mean=MEAN )
-        print( "x_train: {}".format( x_train.shape ) )
-        print( "y_train: {}".format( y_train.shape ) )
-        print( "x_val  : {}".format( x_val.shape ) )
-        print( "y_val  : {}".format( y_val.shape ) )
+        data, target, train_ends, val_ends = loadData( pathsTracksets, pathsRaycasts, nodes=[b'head', b'center', b'tail_basis', b'tail_end'], nfish=3, N_WRAYS=N_WRAYS, N_VIEWS=N_VIEWS, D_LOC=D_LOC, D_DATA=D_DATA, D_OUT=D_OUT, SPLIT=SPLIT, HIST_SIZE=HIST_SIZE, TARGET_SIZE=TARGET_SIZE, mean=MEAN )
+        print( "data   : {}".format( data.shape ) )
+        print( "target : {}".format( target.shape ) )
+        print( "x_train: {}".format( ( len( train_ends ), HIST_SIZE, D_DATA ) ) )
+        print( "x_val  : {}".format( ( len( val_ends ), HIST_SIZE, D_DATA ) ) )
 
-        traindata, valdata = getDatasets( x_train, y_train, x_val, y_val, BATCH_SIZE=BATCH_SIZE, BUFFER_SIZE=BUFFER_SIZE )
+        traindata, valdata = getDatasets( data, target, train_ends, val_ends, HIST_SIZE=HIST_SIZE, TARGET_SIZE=TARGET_SIZE, BATCH_SIZE=BATCH_SIZE, BUFFER_SIZE=BUFFER_SIZE )
 
-        nmodel = createModel( NAME, U_LSTM, U_DENSE, U_OUT, x_train.shape[-2:], dropout=[0.3,0.3] )
+        nmodel = createModel( NAME, U_LSTM, U_DENSE, U_OUT, ( HIST_SIZE, D_DATA ), dropout=[0.3,0.3] )
 
-        EVAL_INTERVAL = ( x_train.shape[0] ) // BATCH_SIZE
-        VAL_INTERVAL = ( x_val.shape[0] ) // BATCH_SIZE
+        EVAL_INTERVAL = len( train_ends ) // BATCH_SIZE
+        VAL_INTERVAL = len( val_ends ) // BATCH_SIZE
 
         history = nmodel.fit( traindata, epochs=EPOCHS, steps_per_epoch=EVAL_INTERVAL, validation_data=valdata, validation_steps=VAL_INTERVAL )
 
@@ -487,21 +397,6 @@ def main():
         pathsTracksets = [same1]
         pathsRaycasts = [same1rays]
 
-        # x_train, y_train, x_val, y_val = loadData( pathsTracksets, pathsRaycasts, nodes=[b'head', b'center', b'tail_basis', b'tail_end'], nfish=3, N_WRAYS=N_WRAYS, N_VIEWS=N_VIEWS, D_LOC=D_LOC, D_DATA=D_DATA, D_OUT=D_OUT, SPLIT=SPLIT, HIST_SIZE=HIST_SIZE, TARGET_SIZE=TARGET_SIZE, mean=MEAN )
-        # print( "x_train: {}".format( x_train.shape ) )
-        # print( "y_train: {}".format( y_train.shape ) )
-        # print( "x_val  : {}".format( x_val.shape ) )
-        # print( "y_val  : {}".format( y_val.shape ) )
-
-        # traindata, valdata = getDatasets( x_train, y_train, x_val, y_val, BATCH_SIZE=BATCH_SIZE, BUFFER_SIZE=BUFFER_SIZE )
-        # for x, y in traindata.take(1):
-        #     predictun = nmodel.predict( x )
-        #     print( "target" )
-        #     print( y[0] )
-
-        # print( "prediction" )
-        # print( predictun[0] )
-
         startinput, startpos, startloc = loadStartData( diff1, diff1rays, [b'head', b'center', b'tail_basis', b'tail_end'], 3, notrandom=STARTSEQ, HIST_SIZE=HIST_SIZE, TARGET_SIZE=TARGET_SIZE, N_WRAYS=N_WRAYS, D_DATA=D_DATA, N_VIEWS=N_VIEWS, D_LOC=D_LOC, MEAN=MEAN )
 
         pos, posC, nLocs = simulate( model=nmodel, nnodes=N_NODES, nfish=N_FISH, startinput=startinput, startpos=startpos, startloc=startloc, timesteps=SIM_STEPS, N_VIEWS=N_VIEWS, N_WRAYS=N_WRAYS, D_LOC=D_LOC, FOV_WALLS=FOV_WALLS, MAX_VIEW_RANGE=MAX_VIEW_RANGE, mean=MEAN )
@@ -0,0 +1,145 @@
+# NumPy inference for models of nmodel.createModel (LSTM -> Dropout -> Dense -> Dropout -> Dense)
+import time
+import numpy as np
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1 / ( 1 + np.exp( -x ) ),
+    "hard_sigmoid": lambda x: np.clip( 0.2 * x + 0.5, 0, 1 ),
+    "relu": lambda x: np.maximum( x, 0 ),
+}
+
+def exportWeights( modelPath, path=None ):
+    """
+    Dumps the weights of a saved model (see nmodel.saveModel) into a .npz file that NumpyModel reads,
+    path defaults to modelPath + ".npz". Only this needs tensorflow.
+    Dropout layers are left out, they do nothing in inference.
+    """
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model( modelPath )
+    if path is None:
+        path = modelPath.rstrip( "/" ) + ".npz"
+
+    lstm = model.layers[0]
+    assert isinstance( lstm, tf.keras.layers.LSTM )
+    config = lstm.get_config()
+    kernel, recurrent, bias = lstm.get_weights()
+    arrays = {
+        "lstm_kernel": kernel,
+        "lstm_recurrent_kernel": recurrent,
+        "lstm_bias": bias,
+        "lstm_activation": np.array( config["activation"] ),
+        "lstm_recurrent_activation": np.array( config["recurrent_activation"] ),
+    }
+    dense = [layer for layer in model.layers[1:] if isinstance( layer, tf.keras.layers.Dense )]
+    for i, layer in enumerate( dense ):
+        kernel, bias = layer.get_weights()
+        arrays["dense{}_kernel".format( i )] = kernel
+        arrays["dense{}_bias".format( i )] = bias
+        arrays["dense{}_activation".format( i )] = np.array( layer.get_config()["activation"] )
+    arrays["dense_count"] = np.array( len( dense ) )
+
+    np.savez( path, **arrays )
+    return path
+
+
+class NumpyModel:
+    """
+    Forward pass of an exported model in NumPy, batched:
+    model( windows ) predicts from windows (batch, frames, D_DATA) starting with a zero state, like the keras model.
+    Stateful use like nmodel.StatefulRollout: warmup( windows ) once, then step( inp ) per frame.
+    """
+    def __init__( self, path, dtype=np.float32 ):
+        with np.load( path ) as arr:
+            self.kernel = arr["lstm_kernel"].astype( dtype )
+            self.recurrent = arr["lstm_recurrent_kernel"].astype( dtype )
+            self.bias = arr["lstm_bias"].astype( dtype )
+            self.activation = ACTIVATIONS[str( arr["lstm_activation"] )]
+            self.recurrent_activation = ACTIVATIONS[str( arr["lstm_recurrent_activation"] )]
+            self.dense = [
+                ( arr["dense{}_kernel".format( i )].astype( dtype ), arr["dense{}_bias".format( i )].astype( dtype ), ACTIVATIONS[str( arr["dense{}_activation".format( i )] )] )
+                for i in range( int( arr["dense_count"] ) )
+            ]
+        self.dtype = dtype
+        self.units = self.recurrent.shape[0]
+        self.h = None
+        self.c = None
+
+    def _cell( self, z, h, c ):
+        """
+        One LSTM step, z is the input projection x @ kernel + bias, gates in keras order i, f, c, o
+        """
+        z = z + h @ self.recurrent
+        u = self.units
+        i = self.recurrent_activation( z[:,:u] )
+        f = self.recurrent_activation( z[:,u:2 * u] )
+        c = f * c + i * self.activation( z[:,2 * u:3 * u] )
+        o = self.recurrent_activation( z[:,3 * u:] )
+        return o * self.activation( c ), c
+
+    def _run( self, windows, h, c ):
+        windows = np.asarray( windows, dtype=self.dtype )
+        # input projection of all frames at once, only the recurrence is sequential
+        z = windows @ self.kernel + self.bias
+        for t in range( windows.shape[1] ):
+            h, c = self._cell( z[:,t], h, c )
+        return h, c
+
+    def _head( self, h ):
+        out = h
+        for kernel, bias, activation in self.dense:
+            out = activation( out @ kernel + bias )
+        return out
+
+    def __call__( self, windows ):
+        zeros = np.zeros( ( len( windows ), self.units ), dtype=self.dtype )
+        h, _ = self._run( windows, zeros, zeros )
+        return self._head( h )
+
+    def warmup( self, windows ):
+        """
+        Resets the state and runs the windows (batch, frames, D_DATA), returns the prediction after the last frame
+        """
+        zeros = np.zeros( ( len( windows ), self.units ), dtype=self.dtype )
+        self.h, self.c = self._run( windows, zeros, zeros )
+        return self._head( self.h )
+
+    def step( self, inp ):
+        """
+        Advances all sequences by the frames inp (batch, D_DATA), returns the predictions (batch, D_OUT)
+        """
+        self.h, self.c = self._run( np.asarray( inp )[:,np.newaxis], self.h, self.c )
+        return self._head( self.h )
+
+
+def benchmarkNumpyModel( modelPath, path=None, batch_size=3, steps=200, HIST_SIZE=70 ):
+    """
+    Compares NumpyModel against the keras model it was exported from (needs tensorflow):
+    largest difference of the predictions and time per step for keras predict, the compiled keras call,
+    NumpyModel on the whole window and NumpyModel stateful
+    """
+    import tensorflow as tf
+    from nmodel import getForward
+
+    if path is None:
+        path = exportWeights( modelPath )
+    model = tf.keras.models.load_model( modelPath )
+    npmodel = NumpyModel( path )
+    windows = np.random.default_rng( 0 ).normal( size=( batch_size, HIST_SIZE, npmodel.kernel.shape[0] ) ).astype( np.float32 )
+
+    print( "max difference: {}".format( np.abs( model.predict( windows ) - npmodel( windows ) ).max() ) )
+
+    forward = getForward( model )
+    for name, f in [( "keras predict", model.predict ), ( "keras compiled", forward ), ( "numpy window", npmodel )]:
+        f( windows )
+        t = time.perf_counter()
+        for _ in range( steps ):
+            f( windows )
+        print( "{:15}: {:.3f} ms/step".format( name, ( time.perf_counter() - t ) / steps * 1000 ) )
+    npmodel.warmup( windows )
+    t = time.perf_counter()
+    for _ in range( steps ):
+        npmodel.step( windows[:,-1] )
+    print( "{:15}: {:.3f} ms/step".format( "numpy stateful", ( time.perf_counter() - t ) / steps * 1000 ) )
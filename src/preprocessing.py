@@ -0,0 +1,90 @@
+import os
+import time
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functions import getWallLines
+from reader import extract_coordinates
+from locomotion import getLocomotion, convertLocmotionToBin
+from raycasts import Raycast
+
+STEPS = ["locomotion", "bin", "raycasts"]
+
+def readManifest(path = "data/recordings.csv"):
+    """
+    Reads the manifest of recordings, a ;-separated csv file with the columns name, path, start, end
+    start and end are the frames the recording is trimmed to after extraction (end exclusive), empty means no trim
+    Output: list of dicts with keys name, path, start, end
+    """
+    df = pd.read_csv(path, sep = ";", dtype = {"name": str, "path": str})
+    recordings = []
+    for row in df.itertuples(index = False):
+        recordings.append({
+            "name": row.name,
+            "path": row.path,
+            "start": None if pd.isna(row.start) else int(row.start),
+            "end": None if pd.isna(row.end) else int(row.end),
+        })
+    return recordings
+
+
+def processRecording(recording, steps, wall_lines, raycast_parameters, nodes = [b'head', b'center'], fish_to_extract = [0,1,2], clusters_path = "data/clusters.txt", out_dir = "data", raycast_ending = ".csv"):
+    """
+    Computes the given steps for one recording of the manifest and writes the results into out_dir:
+        locomotion: locomotion_data_<name>.csv
+        bin:        locomotion_data_bin_<name>.csv (needs the locomotion file)
+        raycasts:   raycast_data_<name><raycast_ending>, raycast_ending is .csv, .npy or .npz (see Raycast.getRays)
+    Returns the name of the recording and the time it took in seconds
+    """
+    start_time = time.perf_counter()
+    name = recording["name"]
+    path_loc = os.path.join(out_dir, "locomotion_data_" + name + ".csv")
+
+    tracks = None
+    if "locomotion" in steps or "raycasts" in steps:
+        tracks = extract_coordinates(recording["path"], nodes, fish_to_extract = fish_to_extract)[recording["start"]:recording["end"]]
+
+    if "locomotion" in steps:
+        getLocomotion(tracks, path_loc)
+
+    if "bin" in steps:
+        convertLocmotionToBin(pd.read_csv(path_loc, sep = ";").to_numpy(), clusters_path, os.path.join(out_dir, "locomotion_data_bin_" + name + ".csv"))
+
+    if "raycasts" in steps:
+        ray = Raycast(wall_lines, *raycast_parameters)
+        ray.getRays(tracks, os.path.join(out_dir, "raycast_data_" + name + raycast_ending))
+
+    return name, time.perf_counter() - start_time
+
+
+def preprocess(manifest = "data/recordings.csv", steps = STEPS, processes = None, count_bins_agents = 21, count_rays_walls = 15, radius_fov_agents = 300, radius_fov_walls = 180, max_view_range = 709, count_fishes = 3, clusters_path = "data/clusters.txt", out_dir = "data", raycast_ending = ".csv"):
+    """
+    Regenerates derived data (see processRecording) for all recordings in the manifest.
+    Every recording is processed in its own process, processes = None uses all cores.
+    """
+    for step in steps:
+        assert step in STEPS, "unknown step " + step
+
+    recordings = readManifest(manifest)
+
+    # wall lines are the same for every recording, so only compute them once
+    wall_lines = None
+    if "raycasts" in steps:
+        wall_lines = getWallLines(path = "data/final_redpoint_wall.jpg")
+    raycast_parameters = (count_bins_agents, count_rays_walls, radius_fov_agents, radius_fov_walls, max_view_range, count_fishes)
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers = processes) as executor:
+        futures = [executor.submit(processRecording, rec, steps, wall_lines, raycast_parameters, fish_to_extract = list(range(count_fishes)), clusters_path = clusters_path, out_dir = out_dir, raycast_ending = raycast_ending) for rec in recordings]
+        for i, future in enumerate(as_completed(futures)):
+            name, seconds = future.result()
+            print("||| [{}/{}] {} finished in {:.1f}s. |||".format(i + 1, len(recordings), name, seconds))
+
+    print("||| Preprocessing of {} recordings finished in {:.1f}s. |||".format(len(recordings), time.perf_counter() - start_time))
+
+
+def main():
+    preprocess()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,13 @@ import numpy as np
 import pandas as pd
 import imageio
 import math
-from functions import getRedPoints, defineLines, getDistance, get_intersect, getAngle
+import os
+import json
+import time
+import copy
+from scipy.spatial import cKDTree
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functions import getRedPoints, defineLines, getDistance, get_intersect, getAngle, getRayDistances
 from reader import *
 
 class Raycast:
@@ -14,6 +20,7 @@ class Raycast:
         Angles relative to a fish are seen that from the direction the fish is looking at, 30° to the right are 330° relative to the fish and 30° to the left are 30° relative to the fish.
         """
         self._wall_lines = wall_lines
+        self._wall_lines_array = np.array(wall_lines, dtype = float).reshape(-1, 4)
         self._agent_rays = count_bins_agents
         self._wall_rays = count_rays_walls
         self._radius_walls = radius_field_of_view_walls
@@ -29,86 +36,207 @@ class Raycast:
         self._wall_rays_header = np.array([["fish_" + str(j) + "_wall_ray_" + str((360-radius_field_of_view_walls/2 + i*(radius_field_of_view_walls/(count_rays_walls-1)))%360) for i in range(0, count_rays_walls)] for j in range(0, count_fishes)]).flatten()
         self._wall = [(360-radius_field_of_view_walls/2 + i*(radius_field_of_view_walls/(count_rays_walls-1)))%360 for i in range(0, count_rays_walls)]
 
+        #rays times wall lines per block in getRays, bounds the memory of the intersection kernel
+        self._max_block_size = 2000000
+
+        #optional precomputed WallRayTable, see setWallTable
+        self._wall_table = None
+
+    def setWallTable(self, wall_table):
+        """
+        Use a precomputed WallRayTable (or None for exact intersections) to get the wall rays.
+        The table has to be computed for the same wall lines and max_view_range.
+        """
+        self._wall_table = wall_table
+
     def getRays(self, np_array, path_to_save_to = None):
         """
-        This function expects to be given a numpy array of the shape (rows, count_fishes*4) and saves a csv file at path_to_save_to (path has to end on .csv) if path_to_save_to != None.
+        This function expects to be given a numpy array of the shape (rows, count_fishes*4) and returns a float32 array of shape (rows, len(getHeader())).
+        If path_to_save_to != None it is saved there instead, depending on the ending of the path as
+            .csv: ;-separated csv file with header
+            .npy: numpy array (can be memory-mapped), the header is saved as json list next to it (same path ending on .json)
+            .npz: numpy archive with the entries data and columns
+        Saved raycasts can be read again with readRays().
         The information about each given fish (or object in general) should be first_position_x, first_position_y, second_position_x, second_position_y.
         It is assumed that the fish is looking into the direction of first_positon_x - second_position_x for x and first_positon_y - second_position_y for y.
         """
         self._getFish(np_array)
-        output_np_array = np.array([np.append(self._bins_header, self._wall_rays_header)])
-        temp = np.empty([len(np_array), output_np_array.shape[1]])
-        for i in range(0, len(np_array)):
-            if i!=0 and i%1000 == 0:
-                print("||| Frame " + str(i) + " finished. |||")
-            new_row = [[] for k in range(0, len(self._bins_header))]
-            distance_row = []
-            for j in range(0, len(self._fishes)):
-                #vector of the direction of the fish in question
-                first_component, second_component = (self._fishes[j][i][0] - self._fishes[j][i][2], self._fishes[j][i][1] - self._fishes[j][i][3])
-                look_vector = np.array([first_component, second_component])
-                start_pos = np.array([self._fishes[j][i][2], self._fishes[j][i][3]])
-
-                #get angles and distance for this timestep
-                fishRays = self._getFishRays(j, i, look_vector)
-
-                #put it into bins
-                temp_fishAngles = fishRays[0]
-                temp_fishAngles = [elem + 360 if elem < self._bins[0] else elem for elem in temp_fishAngles]
-                bin_ids = np.digitize(temp_fishAngles, self._bins)
-                for k in range(0, len(bin_ids)):
-                    if bin_ids[k] != len(self._bins) and fishRays[1][k] < self._max_view_range:
-                        new_row[bin_ids[k] + j*(len(self._bins)-1)-1].append(1 - fishRays[1][k]/self._max_view_range)
-
-                #wall rays
-                distance_row = distance_row + self._getWallRays(start_pos, look_vector)
-
-            new_row = [max(new_row[i], default = 0) for i in range(0, len(self._bins_header))] + distance_row
-            temp[i] = new_row
-
-        output_np_array = np.append(output_np_array, temp, axis = 0)
+        output = np.empty([len(np_array), len(self._bins_header) + len(self._wall_rays_header)], dtype = np.float32)
+
+        #agent rays for all frames and fishes at once
+        count_bins = len(self._bins) - 1
+        output[:, :len(self._fishes)*count_bins] = self._getAgentRays()
+
+        #wall rays for all fishes, in blocks of frames
+        fishes = np.stack(self._fishes, axis = 1)
+        block_rows = max(1, self._max_block_size // (len(self._fishes) * len(self._wall) * max(1, len(self._wall_lines_array))))
+        for i in range(0, len(np_array), block_rows):
+            block = fishes[i:i+block_rows]
+            wall_rays = self._getWallRaysBatch(block[:, :, 2:4].reshape(-1, 2), (block[:, :, 0:2] - block[:, :, 2:4]).reshape(-1, 2))
+            output[i:i+block_rows, len(self._fishes)*count_bins:] = wall_rays.reshape(len(block), -1)
 
         if path_to_save_to == None:
-            return output_np_array[1:]
+            return output
+        else:
+            saveRays(path_to_save_to, output, self.getHeader())
+
+    def getRaysChunked(self, np_array, path_to_save_to, chunk_size = 5000, processes = None, verbose = True):
+        """
+        Same as getRays, but splits np_array into chunks of chunk_size frames which are computed in a process pool
+        (processes = None uses all cores). Results are written to path_to_save_to in order as soon as they are done,
+        so only a few chunks are held in memory at the same time. path_to_save_to has to end on .csv or .npy.
+        """
+        ending = os.path.splitext(path_to_save_to)[1]
+        if ending not in (".csv", ".npy"):
+            raise ValueError("getRaysChunked can only write .csv or .npy files, not " + path_to_save_to)
+
+        header = self.getHeader()
+        rows = len(np_array)
+        starts = list(range(0, rows, chunk_size))
+
+        if ending == ".npy":
+            out = np.lib.format.open_memmap(path_to_save_to, mode = "w+", dtype = np.float32, shape = (rows, len(header)))
+            with open(path_to_save_to[:-4] + ".json", "w") as f:
+                json.dump(header, f)
         else:
-            df = pd.DataFrame(data = output_np_array[1:], columns = output_np_array[0])
-            df.to_csv(path_to_save_to, index = None, sep = ";")
+            out = open(path_to_save_to, "w", newline = "")
+            _writeRaysCsv(out, np.empty((0, len(header)), dtype = np.float32), header, True)
 
-    def _getFishRays(self, fish_id, row, look_vector):
-        return_list = [[],[]]
-        for i in range(0, len(self._fishes)):
-            if i != fish_id:
-                #get a vector to each other fish, from the current fish in question
-                vector_to_fish = np.array([self._fishes[i][row][2] - self._fishes[fish_id][row][2], self._fishes[i][row][3] - self._fishes[fish_id][row][3]])
+        try:
+            self._writeChunks(np_array, out, header, starts, chunk_size, processes, verbose)
+        finally:
+            if ending == ".npy":
+                out.flush()
+                del out
+            else:
+                out.close()
 
-                distance = getDistance(self._fishes[i][row][2], self._fishes[i][row][3], self._fishes[fish_id][row][2], self._fishes[fish_id][row][3])
-                angle = getAngle(look_vector, vector_to_fish)
+    def _writeChunks(self, np_array, out, header, starts, chunk_size, processes, verbose):
+        """
+        Computes the chunks of getRaysChunked in a process pool and writes them to out (memmap or open csv file) in order
+        """
+        start_time = time.perf_counter()
+        #send the raycast object (wall table included) to every worker once, without frames of earlier getRays calls
+        raycast = copy.copy(self)
+        raycast._fishes = None
+        with ProcessPoolExecutor(max_workers = processes, initializer = _initRaysWorker, initargs = (raycast,)) as executor:
+            max_pending = 2 * (processes or os.cpu_count() or 1)
+            pending = {}
+            done_chunks = {}
+            next_submit = 0
+            next_write = 0
+            while next_write < len(starts):
+                #keep a bounded amount of chunks in flight
+                while next_submit < len(starts) and len(pending) + len(done_chunks) < max_pending:
+                    start = starts[next_submit]
+                    pending[executor.submit(getRaysOfChunk, np_array[start:start+chunk_size])] = next_submit
+                    next_submit += 1
 
-                return_list[0].append(angle)
-                return_list[1].append(distance)
-        return return_list
+                finished, _ = wait(pending, return_when = FIRST_COMPLETED)
+                for future in finished:
+                    done_chunks[pending.pop(future)] = future.result()
 
-    def _getWallRays(self, start_pos, look_vector):
-        pos_x_axis = np.array([1, 0])
+                #write all chunks that are next in order
+                while next_write in done_chunks:
+                    chunk = done_chunks.pop(next_write)
+                    start = starts[next_write]
+                    if isinstance(out, np.ndarray):
+                        out[start:start+len(chunk)] = chunk
+                    else:
+                        _writeRaysCsv(out, chunk, header, False)
+                    next_write += 1
+                    if verbose:
+                        elapsed = time.perf_counter() - start_time
+                        print("||| Chunk {}/{} (frames {}-{}) finished, {:.0f} frames/s. |||".format(next_write, len(starts), start, start + len(chunk), (start + len(chunk)) / elapsed))
 
-        angle_pos_x_axis_look_vector = getAngle(look_vector, pos_x_axis)
-        distances = [0 for i in range(0, len(self._wall))]
 
-        for i in range(0, len(self._wall)):
-            #first we create a vector that has a certain degree to our look vector
-            angle_relative_to_look_vector = (angle_pos_x_axis_look_vector + (360 - self._wall[i])) % 360
-            new_ray = np.array([math.cos(math.radians(angle_relative_to_look_vector)), math.sin(math.radians(angle_relative_to_look_vector))])
+    def getHeader(self):
+        """
+        Returns the names of the columns returned by getRays as list of strings
+        """
+        return [str(elem) for elem in self._bins_header] + [str(elem) for elem in self._wall_rays_header]
 
-            #and now we check where it collides with which wall and compute the distance to that wall
-            for j in range(0, len(self._wall_lines)):
-                intersection = get_intersect((self._wall_lines[j][0], self._wall_lines[j][1]), (self._wall_lines[j][2], self._wall_lines[j][3]), (start_pos[0], start_pos[1]), (start_pos[0] + new_ray[0], start_pos[1] + new_ray[1]))
+    def _getAgentRays(self):
+        """
+        Computes the agent bins for all frames and fishes at once, returns an array of shape (rows, count_fishes*count_bins_agents)
+        For every fish each bin holds 1 - distance/max_view_range of the nearest other fish inside of that bin (0 if there is none).
+        """
+        rows, count_fishes = len(self._fishes[0]), len(self._fishes)
+        count_bins = len(self._bins) - 1
+        row_ids, fish_ids, angles, distances = self._getFishRays()
 
-                #check if it is between the two points of the line and if it is in max_view_range
-                if intersection[0] >= min(self._wall_lines[j][0], self._wall_lines[j][2]) and intersection[0] <= max(self._wall_lines[j][0], self._wall_lines[j][2]) and getDistance(start_pos[0], start_pos[1], intersection[0], intersection[1]) < self._max_view_range:
-                    distances[i] = (1 - getDistance(start_pos[0], start_pos[1], intersection[0], intersection[1]) / self._max_view_range)
-                    break
+        #put it into bins, angles smaller than the first bin belong to the end of the field of view
+        angles = np.where(angles < self._bins[0], angles + 360, angles)
+        bin_ids = np.digitize(angles, self._bins)
+        valid = bin_ids != len(self._bins)
 
-        return distances
+        #take the maximum value for each bin of each fish
+        output = np.zeros((rows, count_fishes, count_bins))
+        np.maximum.at(output, (row_ids[valid], fish_ids[valid], bin_ids[valid] - 1), 1 - distances[valid] / self._max_view_range)
+        return output.reshape(rows, count_fishes*count_bins)
+
+    def _getFishRays(self):
+        """
+        Finds all pairs of fish that are closer than max_view_range to each other in the same row.
+        Returns arrays row_ids, fish_ids, angles, distances with one entry per fish that sees another fish:
+        angle (in degrees, relative to the look vector of the fish) and distance to the other fish.
+        Pairs are found with a KD-tree over all rows at once, so only neighbours within max_view_range are considered.
+        """
+        fishes = np.stack(self._fishes, axis = 1)
+        rows, count_fishes, _ = fishes.shape
+        look_vectors = fishes[:, :, 0:2] - fishes[:, :, 2:4]
+        centers = fishes[:, :, 2:4].reshape(-1, 2)
+
+        #rows are put far apart on a third axis, so there are no pairs between different rows
+        row_offset = 2 * self._max_view_range + 1
+        points = np.empty((rows * count_fishes, 3))
+        points[:, 0:2] = centers
+        points[:, 2] = np.repeat(np.arange(rows) * row_offset, count_fishes)
+        finite = np.isfinite(centers).all(axis = 1)
+        indices = np.nonzero(finite)[0]
+        pairs = cKDTree(points[finite]).query_pairs(self._max_view_range, output_type = "ndarray")
+        pairs = indices[pairs].reshape(-1, 2)
+
+        #every pair is seen from both fish
+        first = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        second = np.concatenate([pairs[:, 1], pairs[:, 0]])
+        vectors_to_fish = centers[second] - centers[first]
+        distances = np.linalg.norm(vectors_to_fish, axis = 1)
+        in_range = distances < self._max_view_range
+        first, vectors_to_fish, distances = first[in_range], vectors_to_fish[in_range], distances[in_range]
+
+        #same angle as getAngle(look_vector, vector_to_fish), but for all pairs at once
+        look_vectors = look_vectors.reshape(-1, 2)[first]
+        dot = look_vectors[:, 0] * vectors_to_fish[:, 0] + look_vectors[:, 1] * vectors_to_fish[:, 1]
+        det = look_vectors[:, 0] * vectors_to_fish[:, 1] - look_vectors[:, 1] * vectors_to_fish[:, 0]
+        angles = np.degrees(np.arctan2(det, dot)) % 360
+        return first // count_fishes, first % count_fishes, angles, distances
+
+    def _getWallRays(self, start_pos, look_vector):
+        """
+        Wall rays for a single fish, returns a list with one value per ray
+        """
+        return list(self._getWallRaysBatch(np.array([start_pos], dtype = float), np.array([look_vector], dtype = float))[0])
+
+    def _getWallRaysBatch(self, start_pos, look_vectors):
+        """
+        Wall rays for many fishes at once.
+        start_pos and look_vectors are arrays of shape (n, 2), returns an array of shape (n, count_rays_walls)
+        holding 1 - distance/max_view_range to the nearest wall hit by each ray (0 if it is out of view range).
+        """
+        #same as getAngle(look_vector, (1, 0)) for every look vector
+        angle_pos_x_axis_look_vector = np.degrees(np.arctan2(-look_vectors[:, 1], look_vectors[:, 0])) % 360
+
+        #create vectors that have a certain degree to our look vectors
+        angles_relative_to_look_vector = (angle_pos_x_axis_look_vector[:, np.newaxis] + (360 - np.array(self._wall))) % 360
+        if self._wall_table is not None:
+            return self._wall_table.lookup(start_pos, angles_relative_to_look_vector)
+        angles_relative_to_look_vector = np.radians(angles_relative_to_look_vector)
+        new_rays = np.stack([np.cos(angles_relative_to_look_vector), np.sin(angles_relative_to_look_vector)], axis = -1)
+
+        #and now we check where they collide with the walls and compute the distance to the nearest one
+        distances = getRayDistances(start_pos[:, np.newaxis, :], new_rays, self._wall_lines_array)
+        return np.where(distances < self._max_view_range, 1 - distances / self._max_view_range, 0)
 
     def _getFish(self, np_array):
         #Create a seperate numpy array for each fish
@@ -116,26 +244,164 @@ class Raycast:
         for i in range(0, int(np_array.shape[1]/4)):
             self._fishes.append(np_array[:, i*4:(i+1)*4].astype(float))
 
-def updateRaycasts():
-    COUNT_BINS_AGENTS = 21
-    WALL_RAYS_WALLS = 15
-    RADIUS_FIELD_OF_VIEW_WALLS = 180
-    RADIUS_FIELD_OF_VIEW_AGENTS = 300
-    MAX_VIEW_RANGE = 709
-    COUNT_FISHES = 3
-    our_wall_lines = defineLines(getRedPoints(path = "data/final_redpoint_wall.jpg"))
 
-    ray = Raycast(our_wall_lines, COUNT_BINS_AGENTS, WALL_RAYS_WALLS, RADIUS_FIELD_OF_VIEW_AGENTS, RADIUS_FIELD_OF_VIEW_WALLS, MAX_VIEW_RANGE, COUNT_FISHES)
+_worker_raycast = None
+
+def _initRaysWorker(raycast):
+    """
+    Initializer of the getRaysChunked process pool, keeps the raycast object of this worker process
+    """
+    global _worker_raycast
+    _worker_raycast = raycast
+
+
+def getRaysOfChunk(np_array):
+    """
+    Worker for Raycast.getRaysChunked, returns the raycasts of np_array
+    """
+    return _worker_raycast.getRays(np_array)
+
+
+def saveRays(path, data, columns):
+    """
+    Saves raycasts with their column names, the format depends on the ending of path (.csv, .npy or .npz), see Raycast.getRays
+    """
+    ending = os.path.splitext(path)[1]
+    if ending == ".npy":
+        np.save(path, data)
+        with open(path[:-4] + ".json", "w") as f:
+            json.dump(list(columns), f)
+    elif ending == ".npz":
+        np.savez(path, data = data, columns = np.array(columns))
+    else:
+        _writeRaysCsv(path, data, columns, True)
+
+
+def _writeRaysCsv(path_or_file, data, columns, header):
+    """
+    csv writer of saveRays, getRaysChunked appends its chunks with it (header = False) so both give the same format
+    """
+    df = pd.DataFrame(data = data, columns = columns)
+    df.to_csv(path_or_file, index = None, sep = ";", header = header)
+
+
+def readRays(path):
+    """
+    Reads raycasts saved by Raycast.getRays or saveRays and returns (data, columns)
+    .npy files are memory-mapped read-only, so loading them is nearly free
+    .npy and .npz keep the float32 they were saved with, .csv files come back as float64 like pandas reads them
+    """
+    ending = os.path.splitext(path)[1]
+    if ending == ".npy":
+        with open(path[:-4] + ".json", "r") as f:
+            columns = json.load(f)
+        return np.load(path, mmap_mode = "r"), columns
+    elif ending == ".npz":
+        with np.load(path) as f:
+            return f["data"], [str(elem) for elem in f["columns"]]
+    else:
+        df = pd.read_csv(path, sep = ";")
+        return df.to_numpy(), list(df.columns)
+
+
+class WallRayTable:
+    def __init__(self, wall_lines, max_view_range, cell_size = 4, count_angles = 180, table = None):
+        """
+        Precomputed wall rays for a fixed tank.
+        For a grid of positions (cell_size pixels apart, covering the bounding box of the wall lines) and count_angles ray
+        directions (angles in degrees relative to the positive x axis) the table stores 1 - distance/max_view_range to the
+        nearest wall, 0 if it is out of view range. Lookups interpolate linearly between the grid points, so they cost the
+        same no matter how many wall lines there are.
+        """
+        self._wall_lines = np.array(wall_lines, dtype = float).reshape(-1, 4)
+        self._max_view_range = max_view_range
+        self._cell_size = cell_size
+        self._count_angles = count_angles
+
+        points = self._wall_lines.reshape(-1, 2)
+        self._origin = points.min(axis = 0)
+        self._shape = tuple(np.ceil((points.max(axis = 0) - self._origin) / cell_size).astype(int) + 1)
+
+        self._table = self._compute() if table is None else table
+
+    def _compute(self):
+        xs = self._origin[0] + np.arange(self._shape[0]) * self._cell_size
+        ys = self._origin[1] + np.arange(self._shape[1]) * self._cell_size
+        grid = np.stack(np.meshgrid(xs, ys, indexing = "ij"), axis = -1).reshape(-1, 2)
 
-    ray.getRays(extract_coordinates("data/sleap_1_diff1.h5", [b'head', b'center'], fish_to_extract=[0,1,2]), "data/raycast_data_diff1.csv")
-    ray.getRays(extract_coordinates("data/sleap_1_diff2.h5", [b'head', b'center'], fish_to_extract=[0,1,2]), "data/raycast_data_diff2.csv")
-    ray.getRays(extract_coordinates("data/sleap_1_diff3.h5", [b'head', b'center'], fish_to_extract=[0,1,2])[:17000], "data/raycast_data_diff3.csv")
-    ray.getRays(extract_coordinates("data/sleap_1_diff4.h5", [b'head', b'center'], fish_to_extract=[0,1,2])[120:], "data/raycast_data_diff4.csv")
+        table = np.empty((len(grid), self._count_angles), dtype = np.float32)
+        for i in range(0, self._count_angles):
+            angle = np.radians(i * 360 / self._count_angles)
+            distances = getRayDistances(grid, np.array([math.cos(angle), math.sin(angle)]), self._wall_lines)
+            table[:, i] = np.where(distances < self._max_view_range, 1 - distances / self._max_view_range, 0)
 
-    ray.getRays(extract_coordinates("data/sleap_1_same1.h5", [b'head', b'center'], fish_to_extract=[0,1,2]), "data/raycast_data_same1.csv")
-    ray.getRays(extract_coordinates("data/sleap_1_same3.h5", [b'head', b'center'], fish_to_extract=[0,1,2])[130:], "data/raycast_data_same3.csv")
-    ray.getRays(extract_coordinates("data/sleap_1_same4.h5", [b'head', b'center'], fish_to_extract=[0,1,2]), "data/raycast_data_same4.csv")
-    ray.getRays(extract_coordinates("data/sleap_1_same5.h5", [b'head', b'center'], fish_to_extract=[0,1,2]), "data/raycast_data_same5.csv")
+        return table.reshape(self._shape[0], self._shape[1], self._count_angles)
+
+    def lookup(self, positions, angles):
+        """
+        positions: array (n, 2) of ray start points, angles: array (n, k) of ray directions in degrees relative to the positive x axis
+        Returns array (n, k) with the interpolated wall rays, positions outside of the table are clamped to its border.
+        """
+        #fractional indices into the table
+        grid = np.clip((positions - self._origin) / self._cell_size, 0, np.array(self._shape) - 1)
+        angle = (np.asarray(angles) % 360) * self._count_angles / 360
+
+        x0 = np.minimum(np.floor(grid[:, 0]).astype(int), self._shape[0] - 2)[:, np.newaxis]
+        y0 = np.minimum(np.floor(grid[:, 1]).astype(int), self._shape[1] - 2)[:, np.newaxis]
+        a0 = np.floor(angle).astype(int) % self._count_angles
+        a1 = (a0 + 1) % self._count_angles
+        wx = grid[:, 0, np.newaxis] - x0
+        wy = grid[:, 1, np.newaxis] - y0
+        wa = angle - np.floor(angle)
+
+        #trilinear interpolation, angles wrap around
+        result = 0
+        for dx, fx in ((0, 1 - wx), (1, wx)):
+            for dy, fy in ((0, 1 - wy), (1, wy)):
+                result = result + fx * fy * ((1 - wa) * self._table[x0 + dx, y0 + dy, a0] + wa * self._table[x0 + dx, y0 + dy, a1])
+        return result
+
+    def matches(self, wall_lines, max_view_range):
+        """
+        Returns whether this table was computed for the given wall lines and max_view_range
+        """
+        wall_lines = np.array(wall_lines, dtype = float).reshape(-1, 4)
+        return max_view_range == self._max_view_range and wall_lines.shape == self._wall_lines.shape and np.allclose(wall_lines, self._wall_lines)
+
+    def save(self, path):
+        """
+        Saves the table as .npz file
+        """
+        np.savez(path, table = self._table, wall_lines = self._wall_lines, max_view_range = self._max_view_range, cell_size = self._cell_size, count_angles = self._count_angles)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a table saved with save()
+        """
+        with np.load(path) as f:
+            return cls(f["wall_lines"], float(f["max_view_range"]), float(f["cell_size"]), int(f["count_angles"]), table = f["table"])
+
+
+def getWallTable(wall_lines, max_view_range, path = "data/wall_table.npz", cell_size = 4, count_angles = 180):
+    """
+    Loads the WallRayTable from path, if it does not exist or was computed for other walls it is computed and saved at path.
+    """
+    if os.path.isfile(path):
+        wall_table = WallRayTable.load(path)
+        if wall_table.matches(wall_lines, max_view_range) and wall_table._cell_size == cell_size and wall_table._count_angles == count_angles:
+            return wall_table
+
+    wall_table = WallRayTable(wall_lines, max_view_range, cell_size, count_angles)
+    wall_table.save(path)
+    return wall_table
+
+def updateRaycasts():
+    """
+    Update all raycast files listed in data/recordings.csv
+    """
+    from preprocessing import preprocess
+    preprocess(steps = ["raycasts"])
 
 def main():
     #Set variables
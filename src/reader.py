@@ -2,13 +2,21 @@ import h5py
 import pandas as pd
 import numpy as np
 import sys
+import os
+import hashlib
 import scipy
 import functions
 
-def read_slp(file, loud = False):
+def read_slp(file, loud = False, frames = None, fish_to_extract = None, nodes_to_extract = None):
     """
     reads a sleap file and converts it into appropiate format
+    frames: (start, end) of the frames to read, end is exclusive and can be None, all frames if None
+    fish_to_extract: array containing the fishes to read, all if None
+    nodes_to_extract: names of the nodes to read, all if None. Nodes are returned in the order of the file
+    Only the requested hyperslab of tracks and track_occupancy is read from the file.
+    Output: (node_names, track_names, track_occupancy [frames, fish], tracks [fish, x/y, nodes, frames])
     """
+    start, end = (0, None) if frames is None else frames
 
     # Open file
     with h5py.File(file, 'r') as f:
@@ -41,69 +49,66 @@ def read_slp(file, loud = False):
 
             # CONFIDENCE WIRD NICHT MITGEGEBEN. ICH WERD NOCHMAL SCHAUEN WIE MAN DAS EVTL- berücksichtigen kann.
 
-        return (node_names[:], track_names[:], track_occupancy[:], tracks[:])
+        all_node_names = node_names[:]
+        all_track_names = track_names[:]
+        n_fishes = len(all_track_names)
 
+        if fish_to_extract is None:
+            fish_to_extract = range(n_fishes)
+        if len(fish_to_extract) == 0 or min(fish_to_extract) < 0 or max(fish_to_extract) >= n_fishes:
+            raise ValueError("invalid fishes in argument fish_to_extract: {}, file has {} fish".format(list(fish_to_extract), n_fishes))
 
-def extract_rows(file, nodes_to_extract, fish_to_extract = [0,1,2], verbose = False):
+        # Get indices of wanted nodes
+        if nodes_to_extract is None:
+            node_indices = np.arange(len(all_node_names))
+        else:
+            node_indices = np.where(np.isin(all_node_names, nodes_to_extract))[0]
+            if len(node_indices) == 0:
+                raise ValueError("invalid node_names: {}".format(nodes_to_extract))
+            elif len(node_indices) != len(nodes_to_extract):
+                raise ValueError("mapping node_names to nodes in file failed: {}".format(nodes_to_extract))
+
+        # Read only the wanted hyperslab, h5py allows a single index list per selection, so read fish by fish
+        frame_slice = slice(start, end)
+        n_frames = len(range(*frame_slice.indices(tracks.shape[-1])))
+        # Memory is laid out as [frames, fish, nodes, x/y] so extract_rows() can flatten it without copying,
+        # out_tracks is only a transposed view on it
+        buffer = np.empty((n_frames, len(fish_to_extract), len(node_indices), tracks.shape[1]), dtype=tracks.dtype)
+        out_tracks = buffer.transpose(1, 3, 2, 0)
+        for i, fish in enumerate(fish_to_extract):
+            out_tracks[i] = tracks[fish, :, list(node_indices), frame_slice]
+        out_occupancy = track_occupancy[frame_slice, :][:, list(fish_to_extract)]
+
+        return (all_node_names[node_indices], all_track_names[list(fish_to_extract)], out_occupancy, out_tracks)
+
+
+def extract_rows(file, nodes_to_extract, fish_to_extract = [0,1,2], frames = None, verbose = False):
     """
     Extracts specific rows for given sleap file and returns numpy array
     nodes_to_extract: String array containing at least one of: [b'head', b'center', b'l_fin_basis', b'r_fin_basis', b'l_fin_end', b'r_fin_end', b'l_body', b'r_body', b'tail_basis', b'tail_end']
     fish_to_extract: array containing the fishes you want to extract
+    frames: (start, end) of the frames you want to extract, end is exclusive and can be None, all frames if None
+    Only the requested fish, nodes and frames are read from the file.
     Output: nparray of form: [frames, [node0_fish0_x, node0_fish0_y, node1_fish0_x, node1_fish0_y, ..., node0_fish1_x, node0_fish1_y, ...]
     """
 
     # Get data from file
-    node_names, track_names, track_occupancy, tracks = read_slp(file)
+    node_names, track_names, track_occupancy, tracks = read_slp(file, frames=frames, fish_to_extract=fish_to_extract, nodes_to_extract=nodes_to_extract)
+    n_fishes, _, n_nodes, n_frames = tracks.shape
 
     # Print some information about read data
-    n_frames = len(tracks[0,0,0,:])
-    n_fishes = len(track_names[:])
-
     if verbose:
         print("File: ", file)
-        print("Nodes: ", len(node_names[:]))
-        print("Frames in video: ", )
-        print("Fish in dataset: ", n_fishes)
+        print("Nodes: ", node_names)
+        print("Frames: ", n_frames)
+        print("Fish extracted: ", n_fishes)
         print("Fish - Tracked frames: ")
         for x in range(n_fishes):
-            print("{} - {} frames".format(x, len(np.where(track_occupancy[:,x] == 1)[0] )))
-
-    if max(fish_to_extract) >= n_fishes:
-        print("Error: invalid fishes in argument fish_to_extract")
-        sys.exit
-
-    # Get indices of wanted nodes
-    node_indices = list(np.where( np.in1d(node_names, nodes_to_extract) )[0])
-    if len(node_indices) == 0:
-        print("Error: invalid node_names")
-    elif len(node_indices) != len(nodes_to_extract):
-        print("Error: mapping node_names to nodes in file failed")
-    else:
-        if verbose:
-            print("Node indices are ", node_indices)
-
-    # Put frames second, convert to 2d array
-    tr = tracks.reshape(-1, tracks.shape[-1]).transpose()
-
-    # Swap x and y values into right positions
-    # Stackoverflow magic https://stackoverflow.com/a/20265477
-    permutation = [0,2,4,6,8,10,12,14,16,18,1,3,5,7,9,11,13,15,17,19,20,22,24,26,28,30,32,34,36,38,21,23,25,27,29,31,33,35,37,39,40,42,44,46,48,50,52,54,56,58,41,43,45,47,49,51,53,55,57,59]
-    idx = np.empty_like(permutation)
-    idx[permutation] = np.arange(len(permutation))
-    rtracks = tr[:, idx]
+            print("{} - {} frames".format(fish_to_extract[x], len(np.where(track_occupancy[:,x] == 1)[0] )))
 
-    # Return appropiate data: only wanted nodes, and wanted fishes
-    e_indices = []
-    for i in fish_to_extract:
-        # calculate correct positions for indices
-        x_pos = list(map(lambda x: 2 * x + (20 * i), node_indices))
-        y_pos = list(map(lambda x: 2 * x + 1 + (20 * i), node_indices))
-        # merge both into one list
-        appendix = [pos for tup in zip(x_pos,y_pos) for pos in tup]
-
-        e_indices = e_indices + appendix
-
-    return rtracks[:, e_indices]
+    # Put frames first and x and y of every node next to each other: [fish, x/y, nodes, frames] -> [frames, fish, nodes, x/y]
+    # read_slp() already stores the data in this order, so this is a view and not a copy
+    return tracks.transpose(3, 0, 2, 1).reshape(n_frames, n_fishes * n_nodes * 2)
 
 
 def interpolate_missing_values(data, verbose = False):
@@ -111,177 +116,85 @@ def interpolate_missing_values(data, verbose = False):
     input: values in the format of extract_rows()
     output: values in same format, without nan rows
     careful: this directly modifies your data
+    Nan runs are linearly interpolated between the surrounding defined values,
+    leading nans take the first defined value and trailing nans the last one.
+    Columns without any defined value are left untouched.
     """
     if verbose:
         print("Interpolated missing values")
     n_row, n_col = data.shape
 
-    # Iterate through every row for each column
-    for col in range(n_col):
-
-        curr_row = 0
-        last_not_nan_row = -1
-        while curr_row < n_row :
-
-            if not np.isnan(data[curr_row, col]):
-                # Marc (harr harr) as non nan value
-                last_not_nan_row = curr_row
-            elif last_not_nan_row == -1:
-                # Edge case, you start with nan value
-                # This case, take first defined value und place it inside
-                while np.isnan(data[curr_row, col]):
-                    curr_row += 1
-                last_not_nan_row = 0
-                while last_not_nan_row < curr_row:
-                    data[last_not_nan_row, col] = data[curr_row, col]
-                    last_not_nan_row += 1
-                # @TODO (if time): derive movement vector and add that to missing values (difficulty: if there is a directly missing nan afterwards)
-            else:
-                # move to next non nan row
-                rows_moved = 0
-                while curr_row < n_row and np.isnan(data[curr_row, col]):
-                    curr_row += 1
-                    rows_moved += 1
-
-                last_real_value = data[last_not_nan_row, col]
-
-                if curr_row >= n_row:
-                    # Edge Case, you end with nan value:
-                    # Just place last defined value in
-                    while last_not_nan_row < curr_row:
-                        data[last_not_nan_row, col] = last_real_value
-                        last_not_nan_row += 1
-                else:
-                    # compute distance between both defined rows
-                    distance =  last_real_value - data[curr_row, col]
-                    # compute step sizes in between
-                    step = distance / (rows_moved + 1)
-                    # Fill values in between
-                    last_not_nan_row += 1
-                    step_count = 1
-                    while last_not_nan_row < curr_row:
-                        data[last_not_nan_row, col] = last_real_value - step * step_count
-                        assert step_count <= rows_moved
-                        step_count += 1
-                        last_not_nan_row += 1
-
-            curr_row += 1
-    return data
+    nans = np.isnan(data)
+    # Only touch columns which actually contain nan values
+    cols = np.where(nans.any(axis=0) & ~nans.all(axis=0))[0]
+    rows = np.arange(n_row)
+    for col in cols:
+        valid = ~nans[:, col]
+        # np.interp keeps the edge values constant outside of the defined range
+        data[nans[:, col], col] = np.interp(rows[nans[:, col]], rows[valid], data[valid, col])
 
-
-def replace_point_by_middle(data, col, i1, i2, i3):
-    """
-    Replaces i2 by the point in the middle of i1 and i2, if i2 does not exist,
-    it takes the vector from i-1 to i and adds it on i for i2
-    """
-    n_rows, n_cols = data.shape
-    if i3 < n_rows:
-        # Take middlepoint from value before and behind outlier as new value
-        midway = (data[i1, col] - data[i3, col])/2
-        newval = data[i1, col] - midway
-    else:
-        # Take difference from both values before and replace outlier with it
-        lastdiff = data[i1 - 1, col] - data[i1, col]
-        newval = data[i1, col] - lastdiff
-
-    data[i2, col] = newval
+    return data
 
 
-def correct_outlier(data, col1, col2, i1, max_tolerated_movement):
+class OutlierError(Exception):
     """
-    Recursive function to adjust distance between i1 and i1+1 so that it is not marked as outliers.
-    Recursively removes outliers created this way
-    I am pretty sure this is a more special case of correct_wrongly_interpolated_outliers. But refactoring is not the job now
+    Raised when outliers can not be interpolated, because there are no valid frames left behind them.
+    frame is the last valid frame before the outliers, col the column of its x value in the data
     """
-    n_rows, n_cols = data.shape
-    assert i1 + 1 < n_rows
-
-    replace_point_by_middle(data, col1, i1, i1 + 1, i1 + 2)
-    replace_point_by_middle(data, col2, i1, i1 + 1, i1 + 2)
-
-    dis_1 = functions.getDistance(data[i1,col1], data[i1,col2], data[i1 + 1,col1], data[i1 + 1,col2])
-    if i1 + 2 < n_rows:
-        dis_2 = functions.getDistance(data[i1 + 1,col1], data[i1 + 1,col2], data[i1 + 2,col1], data[i1 + 2,col2])
-    if abs(dis_1) > max_tolerated_movement:
-        if i1 == 0:
-            # Edge case when you are at beginning, replace with value above
-            data[i1, col1] = data[i1 + 1, col1]
-            data[i1, col2] = data[i1 + 1, col2]
-        else:
-            # Recursively adjust values
-            correct_outlier(data, col1, col2, i1-1, max_tolerated_movement)
-    if i1 + 2 < n_rows and abs(dis_2) > max_tolerated_movement:
-        if i1 + 3 == n_rows:
-            # Edge case when you are at the start, replace with value below
-            data[i1 + 2, col1] = data[i1 + 1, col1]
-            data[i1 + 2, col2] = data[i1 + 1, col2]
-        else:
-            # Recursively adjust values
-            correct_outlier(data, col1, col2, i1+1, max_tolerated_movement)
+    def __init__(self, frame, col):
+        super().__init__("Max_tolerated movement violation at end of video in column {}: cut video after frame {}".format(col, frame))
+        self.frame = frame
+        self.col = col
 
 
 def fill_steps_in(data, col, i1, i2, n_steps):
     """
     Fills all values in col of data between i1 and i2 evenly spaced between value of i1 and i2
     """
-    first = data[i1,col]
-    step = (first - data[i2, col])/n_steps
-    for x in range(1,n_steps):
-        data[i1 + x, col] = first - step * x
+    data[i1:i2 + 1, col] = np.linspace(data[i1, col], data[i2, col], n_steps + 1)
 
 
-def fill_vector_in(data, col, i1, i2):
+def avg_dis(data, col1, col2, i_start, i_end, n_points):
     """
-    Fills all values in col of data between i1 and i2 evenly spaced with same size as the value i1 - i2
+    Computes the average distance between i_start and i_end
+    for given amount of n_points
     """
-    first = data[i1, col]
-    dis = first - data[i1 - 1, col]
-    n_steps = i2 - i1
-    for x in range(1, n_steps):
-        data[i1 + x, col] = first + dis * x
+    assert n_points > 1
+    return functions.getDistance(data[i_start,col1], data[i_start, col2], data[i_end,col1], data[i_end,col2]) / (n_points - 1)
 
 
-def correct_wrongly_interpolated_outliers(data, col1, col2, out_group, max_tolerated_movement):
+def get_outlier_runs(dist, max_tolerated_movement):
     """
-    Interpolates the values newly for which due to prediction mistakes data was interpolated wrongly
+    Finds all runs of consecutive frames with a movement bigger than max_tolerated_movement
+    dist: output of functions.get_distances()
+    output: arrays cols, starts, ends, one entry per run, ends are inclusive
+            distance ends[i] is the last violation of the run, so frame ends[i] + 1 is the first one after it
     """
-    n_rows, n_cols = data.shape
-    assert n_cols > 1
-    assert len(out_group) > 2
-    i_first = out_group[0]
-    if out_group[-1] + 1 < n_rows:
-        # Interpolate values newly between first and last non outlier value
-        i_last = out_group[-1] + 1
-        n_vals = len(out_group)
-
-        fill_steps_in(data, col1, i_first, i_last, n_vals)  # x
-        fill_steps_in(data, col2, i_first, i_last, n_vals)  # y
-    else:
-        # Edge Case, you reached the end of the file (I wonder if this code will ever be executed)
-        print("OH MY GOD, THIS REALLY HAS BEEN EXECUTED")
-        # Take vector from last defined value
-        i_last = out_group[-1]
-
-        fill_vector_in(data, col1, i_first, i_last)
-        fill_vector_in(data, col2, i_first, i_last)
-
-    # Check if distance for first value has gotten better, (others are checked later anyway)
-    dis = functions.getDistance(data[i_first,col1], data[i_first,col2], data[i_first + 1,col1], data[i_first + 1,col2])
-    if abs(dis) > max_tolerated_movement:
-        # Enter fixing loop
-        correct_outlier(data, col1, col2, i_first, max_tolerated_movement)
-
-
-def interpolate_outliers_rec(data, max_tolerated_movement=20, verbose = False):
+    bad = np.zeros((dist.shape[0] + 2, dist.shape[1]), dtype=np.int8)
+    bad[1:-1] = dist > max_tolerated_movement
+    # +1 where a run starts, -1 after a run ended, ordered by column
+    changes = np.diff(bad, axis=0).T
+    cols, starts = np.where(changes == 1)
+    _, ends = np.where(changes == -1)
+    return cols, starts, ends - 1
+
+
+def interpolate_outliers(data, max_tolerated_movement=20, verbose = False):
     """
     input: values in the format of extract_coordinates()
     output: values in same format, without outlier values
     careful: this directly modifies your data
     do not set max_tolerated_movement less then 16 (15.06) - it will not work :)
+    Each run of consecutive outliers is replaced by evenly spaced points between the last frame before the run and
+    the first frame after it. If the average movement in between would still be too big, the run is extended into
+    the following frames. The runs are found for all columns at once and handled in one pass, so this is linear in
+    the amount of frames.
+    Raises OutlierError if a run can not be closed before the end of the video.
     """
     if verbose:
         print("Interpolate Outliers:")          # Announce this function loudly and passionately
     n_rows, n_cols = data.shape
+    assert n_rows >= 2
 
     # Get distances of all points between 2 frames
     dist = functions.get_distances(data)
@@ -292,29 +205,28 @@ def interpolate_outliers_rec(data, max_tolerated_movement=20, verbose = False):
         print("max:", np.amax(dist, axis=0))
         print("min:", np.amin(dist, axis=0))
 
-    assert n_rows >= 2
-    for col in range(int(n_cols/2)):
-        # Get outliers of specific column
-        i_out =list( np.where(dist[:,col] > max_tolerated_movement)[0])
+    cols, starts, ends = get_outlier_runs(dist, max_tolerated_movement)
+    # last frame that was interpolated for each column, runs before it are already fixed
+    last_end = np.full(n_cols // 2, -1)
+    for col, i_start, i_run_end in zip(cols, starts, ends):
         # column indices in 'data'
         col1, col2 = 2*col, 2*col + 1
-
-        for outlier in i_out:
-            # recheck if outlier candidate is still valid, often when fixing an outlier you fix it for the next distance aswell
-            dis = functions.getDistance(data[outlier,col1], data[outlier,col2], data[outlier + 1,col1], data[outlier + 1,col2])
-            if abs(dis) > max_tolerated_movement:
-                if outlier + 1 in i_out and outlier + 2 in i_out:
-                    # This case is if the interpolation lead to outliers, since the positions outside of the nan values are too far away.
-                    # Get all frames which are behind each other+
-                    out_group = [outlier, outlier + 1, outlier + 2,]
-                    outlier += 2
-                    while outlier + 1 in i_out:
-                        out_group.append(outlier + 1)
-                        outlier += 1
-                    correct_wrongly_interpolated_outliers(data, col1, col2, out_group, max_tolerated_movement)
-                else:
-                    # correct outlier by replacing it with the value in the middle from points before and after it
-                    correct_outlier(data, col1, col2, outlier, max_tolerated_movement)
+        if i_run_end < last_end[col]:
+            continue
+        # run may start inside of the last interpolated part, which is fine now
+        i_start = max(i_start, last_end[col])
+        i_end = i_run_end + 1
+        # Compute distances and check if we would interpolate,
+        # would the dis be > then max_tolerated_movement
+        # if yes, take further points until it works
+        while avg_dis(data, col1, col2, i_start, i_end, (i_end - i_start + 1)) > max_tolerated_movement:
+            i_end += 1
+            if i_end >= n_rows:
+                raise OutlierError(i_start, col1)
+
+        fill_steps_in(data, col1, i_start, i_end, (i_end - i_start))
+        fill_steps_in(data, col2, i_start, i_end, (i_end - i_start))
+        last_end[col] = i_end
 
     # To check, we recalculate distances and look if there is any outliers still left
     if verbose:
@@ -325,126 +237,72 @@ def interpolate_outliers_rec(data, max_tolerated_movement=20, verbose = False):
         print("min:", np.amin(dist, axis=0))
         print("Outliers left: ", np.where(dist[:,] > max_tolerated_movement))
 
+    return data
 
-def error_start(index):
-    """
-    error message and print. Quick and dirty
-    """
-    print("Max_tolerated movement violation at start of video:")
-    print("Cut video before Frame ", index)
-    sys.exit()
 
+# Bump this whenever the cleaning of coordinates changes, so old cache files are not used anymore
+CACHE_VERSION = 1
 
-def error_end(index):
-    """
-    error message print. Quick and dirty
-    """
-    print("Max_tolerated movement violation at end of video:")
-    print("Cut video after Frame ", index)
-    sys.exit()
 
-
-def avg_dis(data, col1, col2, i_start, i_end, n_points):
+def hash_file(file, blocksize = 1 << 20):
     """
-    Computes the average distance between i_start and i_end
-    for given amount of n_points
+    Returns the sha1 hexdigest of the content of file
     """
-    assert n_points > 1
-    return functions.getDistance(data[i_start,col1], data[i_start, col2], data[i_end,col1], data[i_end,col2]) / (n_points - 1)
+    sha = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
 
 
-def interpolate_outliers(data, max_tolerated_movement=20, verbose = False):
+def get_cache_path(cache_dir, file, nodes_to_extract, fish_to_extract, frames, interpolate_nans, interpolate_outlier):
     """
-    input: values in the format of extract_coordinates()
-    output: values in same format, without outlier values
-    careful: this directly modifies your data
-    do not set max_tolerated_movement less then 16 (15.06) - it will not work :)
+    Returns the path of the cache file for the given arguments of extract_coordinates()
+    The name is a hash of the content of file and all arguments, so it changes whenever one of them changes
     """
-    if verbose:
-        print("Interpolate Outliers:")          # Announce this function loudly and passionately
-    n_rows, n_cols = data.shape
-
-    # Get distances of all points between 2 frames
-    dist = functions.get_distances(data)
-
-    if verbose:
-        print("Before:")
-        print("avg:", np.mean(dist, axis=0))
-        print("max:", np.amax(dist, axis=0))
-        print("min:", np.amin(dist, axis=0))
-
-    assert n_rows >= 2
-    for col in range(int(n_cols/2)):
-        # Get outliers of specific column
-        i_out =list( np.where(dist[:,col] > max_tolerated_movement)[0])
-        # column indices in 'data'
-        col1, col2 = 2*col, 2*col + 1
-
-        for outlier in i_out:
-            # recheck if outlier candidate is still valid, often when fixing an outlier you fix it for the next distance aswell
-            curr_dis = functions.getDistance(data[outlier,col1], data[outlier,col2], data[outlier + 1,col1], data[outlier + 1,col2])
-            if abs(curr_dis) > max_tolerated_movement:
-                i_curr = outlier + 1
-                i_start = outlier
-                # Find next point which is no outlier
-                while( dist[i_curr,col] > max_tolerated_movement ):
-                    i_curr += 1
-                    if i_curr >= n_rows:
-                        error_end(outlier)
-                i_end = i_curr
-                # Compute distances and check if we would interpolate,
-                # would the dis be > then max_tolerated_movement
-                # if yes, take further points until it works
-                switch = True
-                while( avg_dis(data, col1, col2, i_start, i_end, (i_end - i_start + 1)) > max_tolerated_movement ):
-                    if switch:
-                        i_end += 1
-                        if( i_end >= n_rows ):
-                            error_end(outlier)
-                    else:
-                        i_start -= 1
-                        if( i_start < 0 ):
-                            error_start(i_curr) #i_curr because it has the latest og outlier
-
-                fill_steps_in(data, col1, i_start, i_end, (i_end - i_start))
-                fill_steps_in(data, col2, i_start, i_end, (i_end - i_start))
+    key = repr((CACHE_VERSION, hash_file(file), sorted(bytes(n) for n in nodes_to_extract), [int(f) for f in fish_to_extract], None if frames is None else tuple(frames), bool(interpolate_nans), bool(interpolate_outlier)))
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".npy")
 
 
-    # To check, we recalculate distances and look if there is any outliers still left
-    if verbose:
-        dist = functions.get_distances(data)
-        print("After:")
-        print("avg:", np.mean(dist, axis=0))
-        print("max:", np.amax(dist, axis=0))
-        print("min:", np.amin(dist, axis=0))
-        print("Outliers left: ", np.where(dist[:,] > max_tolerated_movement))
-
-
-def extract_coordinates(file, nodes_to_extract, fish_to_extract = [0,1,2], interpolate_nans = True, interpolate_outlier = True, i_o_rec = False, verbose = False):
+def extract_coordinates(file, nodes_to_extract, fish_to_extract = [0,1,2], frames = None, interpolate_nans = True, interpolate_outlier = True, cache_dir = "data/cache", verbose = False):
     """
     Extracts specific rows for given sleap file and returns numpy array, cleaning up data if not specified otherwise
     interpolate missing values will always be run if interpolate outliers is activated
     nodes_to_extract: String array containing at least one of: [b'head', b'center', b'l_fin_basis', b'r_fin_basis', b'l_fin_end', b'r_fin_end', b'l_body', b'r_body', b'tail_basis', b'tail_end']
     fish_to_extract: array containing the fishes you want to extract
+    frames: (start, end) of the frames you want to extract, end is exclusive and can be None, all frames if None
+    cache_dir: directory in which cleaned coordinates are cached as .npy files, None disables the cache
+               cached arrays are memory-mapped copy-on-write, so changing them does not change the cache
     Output: nparray of form: [frames, [node0_fish0_x, node0_fish0_y, node1_fish0_x, node1_fish0_y, ..., node0_fish1_x, node0_fish1_y, ...]
-    i_o_rec: interpolation of outliers recursive, may run in recursion limit and takes
-             a bit longer, but sometimes is more accurate and handles edge cases
+    Raises OutlierError if outliers at the end of the video can not be interpolated
     """
-    ret = extract_rows(file, nodes_to_extract, fish_to_extract, verbose=verbose)
+    if cache_dir is not None:
+        cache_path = get_cache_path(cache_dir, file, nodes_to_extract, fish_to_extract, frames, interpolate_nans, interpolate_outlier)
+        if os.path.isfile(cache_path):
+            if verbose:
+                print("Loading cached coordinates from", cache_path)
+            return np.load(cache_path, mmap_mode='c')
+
+    ret = extract_rows(file, nodes_to_extract, fish_to_extract, frames=frames, verbose=verbose)
 
     if interpolate_nans or interpolate_outlier:
         interpolate_missing_values(ret, verbose=verbose)
 
     if interpolate_outlier:
-        if i_o_rec:
-            interpolate_outliers_rec(ret, verbose=verbose)
-        else:
-            interpolate_outliers(ret, verbose=verbose)
+        interpolate_outliers(ret, verbose=verbose)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first, so parallel runs never read a half written cache file
+        tmp_path = "{}.{}.tmp.npy".format(cache_path[:-4], os.getpid())
+        np.save(tmp_path, ret)
+        os.replace(tmp_path, cache_path)
+        if verbose:
+            print("Cached coordinates in", cache_path)
 
     return ret
 
 
-
 if __name__ == "__main__":
     file = "data/sleap_1_diff4.h5"
 
@@ -0,0 +1,221 @@
+# Simulation of trained models, does not import tensorflow unless a keras model is simulated
+import numpy as np
+
+from functions import getAngles, getWallLines
+from locomotion import row_l2c, row_l2c_additional_nodes
+from raycasts import Raycast, getWallTable
+
+def _nView( posFish, posOther, nnodes, nfish ):
+    """
+    Distances and angles from the center of the protagonist to every node of the other fish,
+    works on any amount of leading axes
+    posFish: (..., 4) [head_x, head_y, center_x, center_y]
+    posOther: (..., (nfish - 1) * nnodes * 2)
+    """
+    lead = posOther.shape[:-1]
+    other = posOther.reshape( lead + ( nfish - 1, nnodes, 2 ) )
+    center = posFish[...,np.newaxis,np.newaxis,2:4]
+    # head - center
+    vec_ch = posFish[...,np.newaxis,np.newaxis,0:2] - center
+    # node - center
+    vec_cn = other - center
+    out = np.empty( lead + ( nfish - 1, nnodes, 2 ) )
+    out[...,0] = np.hypot( vec_cn[...,0], vec_cn[...,1] )
+    out[...,1] = getAngles( vec_ch, vec_cn )
+    return out.reshape( lead + ( ( nfish - 1 ) * nnodes * 2, ) )
+
+def getnView( tracksFish, tracksOther, nfish=3 ):
+    """
+    Input: tracks from protagonist fish, only [head,center] expected
+    Output gives distances to all nodes from other fishes in tracks
+    nfish total amount of fish (fish in tracksOther + 1)
+    """
+    rows, cols = tracksFish.shape
+    rows2, cols2 = tracksOther.shape
+    assert rows == rows2
+    assert rows > 1
+    assert cols == 4
+    nnodes = cols2 // (nfish - 1) // 2
+
+    return _nView( tracksFish, tracksOther, nnodes, nfish )
+
+def getnViewSingle( posFish, posOther, nnodes, nfish=3 ):
+    """
+    Same as above but for one row
+    """
+    return _nView( np.asarray( posFish, dtype=float ), np.asarray( posOther, dtype=float ), nnodes, nfish )
+
+
+def getnViewAll( pos, nfish, nnodes ):
+    """
+    getnViewSingle for every fish at once
+    pos: (..., nfish, nnodes, 2) positions of all nodes, head and center first
+    Output: (..., nfish, (nfish - 1) * nnodes * 2)
+    """
+    lead = pos.shape[:-3]
+    # for every fish the other fish, in order
+    others = np.array( [[g for g in range( nfish ) if g != f] for f in range( nfish )] )
+    posOther = pos[...,others,:,:].reshape( lead + ( nfish, ( nfish - 1 ) * nnodes * 2 ) )
+    posFish = pos[...,0:2,:].reshape( lead + ( nfish, 4 ) )
+    return _nView( posFish, posOther, nnodes, nfish )
+
+
+def _isKeras( model ):
+    """
+    keras models are recognized by their predict method, so tensorflow does not have to be imported to check
+    """
+    return hasattr( model, "predict" )
+
+
+def simulate( model, nnodes, nfish, startinput, startpos, startloc, timesteps, N_VIEWS, D_LOC, N_WRAYS, FOV_WALLS, MAX_VIEW_RANGE, mean, wallTable=None, stateful=False ):
+    """
+    returns positions of nodes, then polar position of center, then nLoc of predictions
+    startpos and startloc are not standardized
+    startinput: start window (HIST_SIZE, D_DATA) used for every fish, or one per fish (nfish, HIST_SIZE, D_DATA)
+    model: keras model, npmodel.NumpyModel or a function mapping windows to predictions (see nmodel.getForward),
+        all fish are predicted in one batch per step
+    wallTable: path to a precomputed WallRayTable (computed and saved there if missing), exact wall rays if None
+    stateful: carry the LSTM state from step to step (see nmodel.StatefulRollout) instead of re-running the shifted window,
+        the first prediction is the same, later ones see more than HIST_SIZE frames and so differ slightly
+    """
+    assert len( startpos ) == nnodes * 2 * nfish
+    pos, posCenterPolar, nLoc = simulateEnsemble( model, nnodes, nfish, np.asarray( startinput )[np.newaxis], np.asarray( startpos )[np.newaxis], np.asarray( startloc )[np.newaxis], timesteps, N_VIEWS, D_LOC, N_WRAYS, FOV_WALLS, MAX_VIEW_RANGE, mean, wallTable=wallTable, stateful=stateful )
+    return pos[0], posCenterPolar[0], nLoc[0]
+
+
+def simulateEnsemble( model, nnodes, nfish, startinput, startpos, startloc, timesteps, N_VIEWS, D_LOC, N_WRAYS, FOV_WALLS, MAX_VIEW_RANGE, mean, wallTable=None, stateful=False, noise=None, seed=None, path=None ):
+    """
+    simulate() for B independent rollouts advanced in lockstep, inference, row_l2c and the wall rays
+    run on all B * nfish fish of a step at once
+    startinput: (B, HIST_SIZE, D_DATA) start window per rollout used for every fish, or (B, nfish, HIST_SIZE, D_DATA)
+    startpos: (B, nnodes * 2 * nfish), startloc: (B, D_LOC * nfish), not standardized
+    noise: std of gaussian noise added to the (standardized) predictions, scalar or one per output,
+        every rollout draws from its own generator spawned from seed, so rollout b is the same for any B
+    path: .npy file the positions are written to (memmapped) instead of holding them in memory
+    returns positions (B, timesteps + 1, nfish * nnodes * 2), polar center positions (B, timesteps + 1, nfish * 3)
+    and nLoc of the predictions (B, timesteps, nfish * D_LOC)
+    """
+    startpos = np.asarray( startpos, dtype=float )
+    startinput = np.asarray( startinput, dtype=float )
+    nrollouts = len( startpos )
+    assert startpos.shape == ( nrollouts, nnodes * 2 * nfish )
+    assert startinput.shape[-1] == D_LOC + N_VIEWS + N_WRAYS
+    assert nnodes >= 2
+
+    if mean is not None:
+        arr = np.load( mean, allow_pickle=True )
+        meanv = arr[0]
+        std = arr[1]
+        meanTGT = arr[2]
+        stdTGT = arr[3]
+        print( "Using mean and std:")
+        print( meanv )
+        print( std )
+        print( "Using mean and std for target:" )
+        print( meanTGT )
+        print( stdTGT )
+    if noise is not None:
+        rngs = [np.random.default_rng( s ) for s in np.random.SeedSequence( seed ).spawn( nrollouts )]
+
+    nLoc = np.empty( ( nrollouts, timesteps, (nnodes * 2 + 1) * nfish ) )
+    if path is None:
+        pos = np.empty( ( nrollouts, timesteps + 1, nnodes * 2 * nfish ) ) # saves x, y val for every node
+    else:
+        pos = np.lib.format.open_memmap( path, mode="w+", dtype=float, shape=( nrollouts, timesteps + 1, nnodes * 2 * nfish ) )
+    posCenterPolar = np.empty( ( nrollouts, timesteps + 1, 3 * nfish ) ) # saves c_x, c_y, orienation
+    # Initialize first row
+    pos[:,0] = startpos
+    start = startpos.reshape( nrollouts, nfish, nnodes, 2 )
+    polar = posCenterPolar[:,0].reshape( nrollouts, nfish, 3 )
+    polar[:,:,0:2] = start[:,:,1]
+    # Angle between Fish Orientation and the unit vector
+    # Head - Center
+    vec_ch = start[:,:,0] - start[:,:,1]
+    polar[:,:,2] = np.arctan2( vec_ch[...,1], vec_ch[...,0] ) % ( np.pi * 2 )
+    # one history window per fish, all fish of all rollouts in one batch
+    if startinput.ndim == 3:
+        startinput = np.repeat( startinput[:,np.newaxis], nfish, axis=1 )
+    assert startinput.shape[:2] == ( nrollouts, nfish )
+    modelinput = startinput.reshape( ( nrollouts * nfish, ) + startinput.shape[2:] ).copy()
+    if _isKeras( model ):
+        # tensorflow is only imported for keras models
+        from nmodel import getForward, getStateful
+        model = getStateful( model, nrollouts * nfish ) if stateful else getForward( model )
+    if stateful:
+        rollout = model
+        # the newest frame of the window is replaced by the first step
+        rollout.warmup( modelinput[:,1:] )
+    else:
+        forward = model
+
+    # MARCS RAYCAST OBJECT
+    walllines = getWallLines( path="data/final_redpoint_wall.jpg" )
+    unnecessary = 10
+    raycast_object = Raycast( walllines, unnecessary, N_WRAYS, unnecessary, FOV_WALLS, MAX_VIEW_RANGE, nfish )
+    if wallTable is not None:
+        raycast_object.setWallTable( getWallTable( walllines, MAX_VIEW_RANGE, path=wallTable ) )
+
+    # main loop
+    current = startpos.copy()
+    for t in range( timesteps ):
+        if t % 500 == 0:
+            print( "Frame {:6}".format( t ) )
+        # 1. Compute input for all fish
+        # 2. Compute prediction for all fish in one batch
+        # 3. Compute new positions
+
+        # 1. Input for all fish, one row per fish
+        pos_fish = current.reshape( nrollouts, nfish, nnodes, 2 )
+        inp = np.empty( ( nrollouts, nfish, N_VIEWS + N_WRAYS + D_LOC ) )
+        # nView
+        inp[...,:N_VIEWS] = getnViewAll( pos_fish, nfish, nnodes )
+        # wRays
+        centers = pos_fish[:,:,1].reshape( -1, 2 )
+        inp[...,N_VIEWS:-D_LOC] = raycast_object._getWallRaysBatch( centers, pos_fish[:,:,0].reshape( -1, 2 ) - centers ).reshape( nrollouts, nfish, N_WRAYS )
+        # nLoc
+        if t == 0:
+            inp[...,-D_LOC:] = np.reshape( startloc, ( nrollouts, nfish, D_LOC ) )
+        else:
+            inp[...,-D_LOC:] = nLoc[:,t - 1].reshape( nrollouts, nfish, D_LOC )
+
+        inp = inp.reshape( nrollouts * nfish, -1 )
+        if mean is not None:
+            inp = np.nan_to_num( ( inp - meanv ) / std )
+
+        # 2. Prediction
+        if stateful:
+            prediction = np.asarray( rollout.step( inp ) ).reshape( nrollouts, nfish, D_LOC )
+        else:
+            # Shift all observations
+            modelinput[:,:-1] = modelinput[:,1:]
+            # Insert newest
+            modelinput[:,-1] = inp
+            prediction = np.asarray( forward( modelinput ) ).reshape( nrollouts, nfish, D_LOC )
+
+        if noise is not None:
+            prediction = prediction + np.stack( [rng.standard_normal( ( nfish, D_LOC ) ) for rng in rngs] ) * noise
+
+        if mean is not None:
+            # shift prediction back
+            prediction = prediction * stdTGT + meanTGT
+
+        # prediction = model[:,t].reshape( nrollouts, nfish, D_LOC ) # to test correcness of simulation insert loc files as model
+        nLoc[:,t] = prediction.reshape( nrollouts, -1 )
+
+        # 3. New positions
+
+        # 3.1 new center position
+        posCenterPolar[:,t + 1] = row_l2c( posCenterPolar[:,t], prediction[...,0:3].reshape( nrollouts, -1 ) )
+        polar = posCenterPolar[:,t + 1].reshape( nrollouts, nfish, 3 )
+
+        # 3.2 all the other positions, head first
+        new_pos = current.reshape( nrollouts, nfish, nnodes, 2 )
+        output = row_l2c_additional_nodes( polar, prediction[...,3:] ).reshape( nrollouts, nfish, nnodes - 1, 2 )
+        new_pos[:,:,0] = output[:,:,0]
+        new_pos[:,:,1] = polar[...,0:2]
+        new_pos[:,:,2:] = output[:,:,1:]
+        pos[:,t + 1] = current
+
+    if path is not None:
+        pos.flush()
+    return pos, posCenterPolar, nLoc
@@ -0,0 +1,29 @@
+import numpy as np
+
+from functions import getWindows, multivariate_data
+
+
+def test_getWindows_matches_slices():
+    data = np.arange(60, dtype = float).reshape(20, 3)
+    ends = np.array([4, 7, 20, 5])
+    windows = getWindows(data, ends, 4)
+    assert windows.shape == (4, 4, 3)
+    for window, end in zip(windows, ends):
+        np.testing.assert_array_equal(window, data[end - 4:end])
+
+
+def test_getWindows_matches_multivariate_data():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size = (50, 5))
+    target = data[:, :3]
+    history_size, split = 7, 40
+
+    x_train, y_train = multivariate_data(data, target, 0, split, history_size, 1, 1, single_step = True)
+    ends = np.arange(history_size, split)
+    np.testing.assert_array_equal(getWindows(data, ends, history_size), x_train)
+    np.testing.assert_array_equal(target[ends + 1], y_train)
+
+    x_val, y_val = multivariate_data(data, target, split, None, history_size, 1, 1, single_step = True)
+    ends = np.arange(split + history_size, len(data) - 1)
+    np.testing.assert_array_equal(getWindows(data, ends, history_size), x_val)
+    np.testing.assert_array_equal(target[ends + 1], y_val)
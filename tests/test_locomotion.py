@@ -0,0 +1,95 @@
+"""
+Checks getLocomotion() against the original frame by frame implementation.
+Run as a script from the repository root to benchmark both on sleap files:
+    PYTHONPATH=src python tests/test_locomotion.py [files]
+"""
+import sys
+import math
+import time
+import numpy as np
+from itertools import chain
+
+from functions import getAngle
+from locomotion import getLocomotion
+from reader import extract_coordinates
+
+
+def getLocomotionLoop(np_array):
+    """
+    Original frame by frame version of getLocomotion() (in radians)
+    """
+    header = np.array([list(chain.from_iterable(("Fish_" + str(i) + "_next_x", "Fish_" + str(i) + "_next_y", "Fish_" + str(i) + "_angle_change_orientation") for i in range(0, int(np_array.shape[1]/4))))])
+    output = np.empty((np_array.shape[0]-1, header.shape[1]))
+
+    for i in range(0, np_array.shape[0]-1):
+        new_row = [0 for k in range(0, int(3*np_array.shape[1]/4))]
+        for j in range(0, int(np_array.shape[1]/4)):
+            head_x = np_array[i, j*4]
+            head_y = np_array[i, j*4+1]
+            center_x = np_array[i, j*4+2]
+            center_y = np_array[i, j*4+3]
+
+            head_x_next = np_array[i+1, j*4]
+            head_y_next = np_array[i+1, j*4+1]
+            center_x_next = np_array[i+1, j*4+2]
+            center_y_next = np_array[i+1, j*4+3]
+
+            #look vector
+            look_vector = (head_x - center_x, head_y - center_y)
+            #new look vector
+            look_vector_next = (head_x_next - center_x_next, head_y_next - center_y_next)
+
+            #convert coordinates to egocentric view (use this https://en.wikipedia.org/wiki/Rotation_of_axes) and use center of current timestep as origin
+            rotate_axis = getAngle(look_vector, (1, 0), mode = "radians")
+
+            #convert center of timestep t
+            center_x, center_y = center_x * math.cos(rotate_axis) + center_y * math.sin(rotate_axis), center_y * math.cos(rotate_axis) - center_x * math.sin(rotate_axis)
+            #convert center of timestep t+1
+            center_x_next, center_y_next = center_x_next * math.cos(rotate_axis) + center_y_next * math.sin(rotate_axis), center_y_next * math.cos(rotate_axis) - center_x_next * math.sin(rotate_axis)
+
+            #move first, then change orientation when reconstructing
+            new_row[j*3] = center_x_next - center_x
+            new_row[j*3+1] = center_y_next - center_y
+            new_row[j*3+2] = getAngle(look_vector, look_vector_next, mode = "radians")
+
+            #convert ori from 0,2pi to -pi,pi
+            new_row[j*3+2] = new_row[j*3+2]-2*np.pi if new_row[j*3+2] > np.pi else new_row[j*3+2]
+        output[i] = new_row
+
+    return output
+
+
+def test_getLocomotion_matches_loop():
+    rng = np.random.default_rng(0)
+    nfish, rows = 3, 200
+    centers = np.cumsum(rng.normal(size = (rows, nfish, 2)), axis = 0) + 400
+    heads = centers + 10 * rng.normal(size = (rows, nfish, 2))
+    tracks = np.concatenate([heads, centers], axis = 2).reshape(rows, nfish * 4)
+
+    expected = getLocomotionLoop(tracks)
+    result = getLocomotion(tracks)
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, rtol = 0, atol = 1e-9)
+    np.testing.assert_allclose(getLocomotion(tracks, mode = "degrees")[:, 2::3], np.degrees(expected[:, 2::3]), rtol = 0, atol = 1e-7)
+
+
+def benchmarkLocomotion(files = ["data/sleap_1_diff1.h5", "data/sleap_1_same1.h5"]):
+    """
+    Compares runtime and output of getLocomotion() and getLocomotionLoop() on given sleap files
+    """
+    for file in files:
+        tracks = extract_coordinates(file, [b'head', b'center'])
+
+        start = time.perf_counter()
+        loop_loc = getLocomotionLoop(tracks)
+        t_loop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vec_loc = getLocomotion(tracks)
+        t_vec = time.perf_counter() - start
+
+        print("{}: loop {:.3f}s, vectorized {:.4f}s, speedup {:.0f}x, max difference {:.2e}".format(file, t_loop, t_vec, t_loop / t_vec, np.abs(loop_loc - vec_loc).max()))
+
+
+if __name__ == "__main__":
+    benchmarkLocomotion(sys.argv[1:] or ["data/sleap_1_diff1.h5", "data/sleap_1_same1.h5"])
@@ -0,0 +1,106 @@
+"""
+Checks interpolate_missing_values() against the original row by row implementation.
+Run as a script from the repository root to benchmark both on the sleap files in data/:
+    PYTHONPATH=src python tests/test_reader.py [files]
+"""
+import sys
+import time
+import numpy as np
+
+from reader import extract_rows, interpolate_missing_values
+
+
+def interpolate_missing_values_loop(data):
+    """
+    Original row by row version of interpolate_missing_values()
+    careful: this directly modifies your data
+    """
+    n_row, n_col = data.shape
+
+    # Iterate through every row for each column
+    for col in range(n_col):
+
+        curr_row = 0
+        last_not_nan_row = -1
+        while curr_row < n_row :
+
+            if not np.isnan(data[curr_row, col]):
+                last_not_nan_row = curr_row
+            elif last_not_nan_row == -1:
+                # Edge case, you start with nan value
+                # This case, take first defined value und place it inside
+                while np.isnan(data[curr_row, col]):
+                    curr_row += 1
+                last_not_nan_row = 0
+                while last_not_nan_row < curr_row:
+                    data[last_not_nan_row, col] = data[curr_row, col]
+                    last_not_nan_row += 1
+            else:
+                # move to next non nan row
+                rows_moved = 0
+                while curr_row < n_row and np.isnan(data[curr_row, col]):
+                    curr_row += 1
+                    rows_moved += 1
+
+                last_real_value = data[last_not_nan_row, col]
+
+                if curr_row >= n_row:
+                    # Edge Case, you end with nan value:
+                    # Just place last defined value in
+                    while last_not_nan_row < curr_row:
+                        data[last_not_nan_row, col] = last_real_value
+                        last_not_nan_row += 1
+                else:
+                    # compute step sizes in between both defined rows
+                    step = (last_real_value - data[curr_row, col]) / (rows_moved + 1)
+                    # Fill values in between
+                    last_not_nan_row += 1
+                    step_count = 1
+                    while last_not_nan_row < curr_row:
+                        data[last_not_nan_row, col] = last_real_value - step * step_count
+                        step_count += 1
+                        last_not_nan_row += 1
+
+            curr_row += 1
+    return data
+
+
+def test_interpolate_missing_values_matches_loop():
+    rng = np.random.default_rng(0)
+    data = rng.uniform(0, 900, (500, 12))
+    # single gaps, long runs, leading and trailing nans
+    data[rng.random(data.shape) < 0.2] = np.nan
+    data[100:180, 3] = np.nan
+    data[:25, 5] = np.nan
+    data[-40:, 7] = np.nan
+
+    expected = interpolate_missing_values_loop(data.copy())
+    result = interpolate_missing_values(data.copy())
+    np.testing.assert_allclose(result, expected, rtol = 0, atol = 1e-9)
+    assert not np.isnan(result).any()
+
+
+def benchmark_interpolation(files, nodes_to_extract):
+    """
+    Compares runtime of interpolate_missing_values() against interpolate_missing_values_loop() on given sleap files
+    and checks that both give the same values
+    """
+    for file in files:
+        rows = extract_rows(file, nodes_to_extract)
+        loop_data = rows.copy()
+        vec_data = rows.copy()
+
+        start = time.perf_counter()
+        interpolate_missing_values_loop(loop_data)
+        t_loop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        interpolate_missing_values(vec_data)
+        t_vec = time.perf_counter() - start
+
+        print("{}: {} nans, loop {:.3f}s, vectorized {:.4f}s, speedup {:.0f}x, max difference {:.2e}".format(file, np.isnan(rows).sum(), t_loop, t_vec, t_loop / t_vec, np.nanmax(np.abs(loop_data - vec_data))))
+
+
+if __name__ == "__main__":
+    files = sys.argv[1:] or ["data/sleap_1_diff1.h5", "data/sleap_1_diff2.h5", "data/sleap_1_diff3.h5", "data/sleap_1_diff4.h5", "data/sleap_1_same1.h5", "data/sleap_1_same3.h5", "data/sleap_1_same4.h5", "data/sleap_1_same5.h5"]
+    benchmark_interpolation(files, [b'head', b'center', b'l_fin_basis', b'r_fin_basis', b'l_fin_end', b'r_fin_end', b'l_body', b'r_body', b'tail_basis', b'tail_end'])